@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 from utils.logger import setup_logger
@@ -11,6 +12,7 @@ class Config:
     PIXABAY_API_KEY = os.getenv('PIXABAY_API_KEY')
     FACEBOOK_ACCESS_TOKEN = os.getenv('FACEBOOK_ACCESS_TOKEN')
     FACEBOOK_PAGE_ID = os.getenv('FACEBOOK_PAGE_ID')
+    FACEBOOK_GRAPH_URL = os.getenv('FACEBOOK_GRAPH_URL', 'https://graph.facebook.com/v18.0')
     
     # Categories
     CATEGORIES = [
@@ -21,7 +23,7 @@ class Config:
         'horror', 'fear', 'halloween'
     ]
     
-    # Video URLs
+    # Video URLs (merged into the background manifest, see BackgroundLibrary)
     VIDEO_URLS = [
         os.getenv(f'VIDEO_URL_{i}') 
         for i in range(1, 21)
@@ -33,8 +35,32 @@ class Config:
     
     # Paths
     TEMP_DIR = 'temp'
+    PREVIEW_DIR = 'previews'
+    VARIANTS_DIR = 'variants'  # Finished output variants, for the targets that want them
     DATA_DIR = 'data'
-    STATE_FILE = os.path.join(DATA_DIR, 'state.json')
+    STATE_DB = os.path.join(DATA_DIR, 'state.db')
+    STATE_FILE = os.path.join(DATA_DIR, 'state.json')  # Legacy JSON state, imported into STATE_DB once
+    PROXY_DIR = os.path.join(DATA_DIR, 'proxies')
+    ASSET_CACHE_DIR = os.path.join(DATA_DIR, 'assets')
+    # Keyframe indexes of cached clips, by content hash: next to the objects, evicted with them
+    KEYFRAME_INDEX_DIR = os.path.join(ASSET_CACHE_DIR, 'objects')
+    ENCODING_PROFILE_DIR = os.path.join(DATA_DIR, 'encoding_profiles')
+    MIX_CACHE_DIR = os.path.join(TEMP_DIR, 'mixes')
+    WORKSPACE_DIR = os.path.join(TEMP_DIR, 'work')
+    MUSIC_LIBRARY_DIR = os.path.join(DATA_DIR, 'music')
+    BACKGROUND_MANIFEST = os.getenv('BACKGROUND_MANIFEST', os.path.join(DATA_DIR, 'backgrounds.json'))
+    DURATION_BUCKET_SECONDS = 15  # Granularity of the background duration index
+    WARMUP_CONCURRENCY = int(os.getenv('WARMUP_CONCURRENCY', '4'))  # Assets processed at once by `main.py warmup`
+    
+    # Per-episode workspaces (tmpfs when it has room, byte budget, GC of leftovers)
+    WORKSPACE_USE_TMPFS = os.getenv('WORKSPACE_USE_TMPFS', 'true').lower() == 'true'
+    WORKSPACE_TMPFS_DIR = os.getenv('WORKSPACE_TMPFS_DIR', '/dev/shm/viral_reels_work')
+    WORKSPACE_BUDGET_BYTES = int(float(os.getenv('WORKSPACE_BUDGET_GB', '5')) * 1024 ** 3)
+    WORKSPACE_TMPFS_BUDGET_BYTES = int(float(os.getenv('WORKSPACE_TMPFS_BUDGET_GB', '1')) * 1024 ** 3)
+    WORKSPACE_EPISODE_BYTES = 300 * 1024 * 1024  # Reserved per episode (voice, subs, output, variants)
+    WORKSPACE_GC_HOURS = 24  # Leftovers older than this are removed at startup
+    WORKSPACE_WAIT_SECONDS = 1800  # Max wait for budget before an episode fails
+    ARTIFACT_SPILL_BYTES = 32 * 1024 * 1024  # Voice/subtitle buffers larger than this go to the workspace
     
     # Episode Settings
     EPISODE_GAP_MINUTES = 15  # Wait time between episodes (15 minutes)
@@ -43,19 +69,100 @@ class Config:
     # Settings
     VOICE_VOLUME_BOOST = 1.3
     MUSIC_VOLUME = 0.20
+    
+    # In-process soundtrack mixing (NumPy) with music ducking under speech
+    USE_NUMPY_MIXER = os.getenv('USE_NUMPY_MIXER', 'true').lower() == 'true'
+    DUCKING_DB = -8.0  # Extra music attenuation while the narrator speaks
+    DUCKING_THRESHOLD_DB = -40.0  # Voice level (dBFS) that counts as speech
+    DUCKING_ATTACK_MS = 80
+    DUCKING_RELEASE_MS = 400
+    MUSIC_CROSSFADE_MS = 500  # Crossfade at music loop seams
+    MIX_CACHE_MAX_AGE_HOURS = 24
+    
+    # Music library (tracks stored once; Pixabay search index refreshed after the TTL)
+    MUSIC_INDEX_TTL_HOURS = 24
+    MUSIC_LIBRARY_TRACKS = 5  # Pixabay tracks kept when there is no usable primary track
+    
+    # Loudness-based mix gains (BS.1770 profiles stored as <asset>.loudness.json);
+    # replaces VOICE_VOLUME_BOOST / MUSIC_VOLUME when the tracks can be measured
+    USE_LOUDNESS_PROFILES = os.getenv('USE_LOUDNESS_PROFILES', 'true').lower() == 'true'
+    VOICE_TARGET_LUFS = -16.0
+    MUSIC_BELOW_VOICE_LU = 14.0  # Same ratio MUSIC_VOLUME = 0.20 aimed for
+    TRUE_PEAK_CEILING_DBTP = -1.0
+    MAX_LOUDNESS_GAIN_DB = 20.0
     OUTPUT_RESOLUTION = (360, 640)
+    # Extra renders from the same decode, moved to VARIANTS_DIR once the episode is uploaded
+    # (none by default), e.g. [{"name": "reels", "resolution": [720, 1280], "crf": 23, "maxrate": "3M"}]
+    OUTPUT_VARIANTS = json.loads(os.getenv('OUTPUT_VARIANTS', '[]'))
     SUBTITLE_FONT_SIZE = 20
     TTS_VOICE = 'en-US-AndrewNeural'
     RUN_INTERVAL_HOURS = 3  # Time between complete story runs
     
+    # Asset cache for downloaded backgrounds (content-addressed, LRU-evicted)
+    ASSET_CACHE_MAX_BYTES = int(float(os.getenv('ASSET_CACHE_MAX_GB', '5')) * 1024 ** 3)
+    ASSET_REVALIDATE_SECONDS = 600  # Skip even the conditional request within this window
+    
+    # Downloads (parallel byte ranges for large files, resumable via .part sidecars)
+    DOWNLOAD_CONNECTIONS = int(os.getenv('DOWNLOAD_CONNECTIONS', '4'))
+    DOWNLOAD_PART_BYTES = 8 * 1024 * 1024
+    DOWNLOAD_MIN_PARALLEL_BYTES = 16 * 1024 * 1024
+    
+    # Background proxies (pre-transcoded to OUTPUT_RESOLUTION, reused across episodes)
+    USE_VIDEO_PROXIES = os.getenv('USE_VIDEO_PROXIES', 'true').lower() == 'true'
+    PROXY_FPS = 30
+    PROXY_GOP_SECONDS = 1  # Short GOP keeps seeking cheap
+    RANDOM_BACKGROUND_OFFSET = os.getenv('RANDOM_BACKGROUND_OFFSET', 'true').lower() == 'true'
+    
+    # Segment-parallel rendering (1 = single FFmpeg process)
+    RENDER_SEGMENTS = int(os.getenv('RENDER_SEGMENTS', '1'))
+    
+    # FFmpeg watchdog: kill and retry a job whose progress stops advancing
+    FFMPEG_STALL_TIMEOUT = 60  # seconds without progress
+    FFMPEG_MAX_RETRIES = 1
+    FFMPEG_STDERR_LINES = 50  # stderr tail kept for error reports
+    
+    # Upload-size-aware encoding: cap bitrate so an episode uploads in
+    # UPLOAD_TIME_RATIO x its duration over the configured uplink (0 = CRF only)
+    UPLOAD_BANDWIDTH_KBPS = int(os.getenv('UPLOAD_BANDWIDTH_KBPS', '0'))
+    UPLOAD_TIME_RATIO = float(os.getenv('UPLOAD_TIME_RATIO', '0.5'))
+    AUDIO_BITRATE_KBPS = 128
+    
+    # Progressive upload: stream fragmented MP4 into a chunked upload session while encoding
+    PROGRESSIVE_UPLOAD = os.getenv('PROGRESSIVE_UPLOAD', 'false').lower() == 'true'
+    UPLOAD_CHUNK_BYTES = 4 * 1024 * 1024
+    
+    # Finished files go through resumable upload sessions in UPLOAD_CHUNK_BYTES chunks.
+    # Chunks in flight at once: keep 1 for the Graph API, which expects them in order
+    UPLOAD_PARALLEL_CHUNKS = int(os.getenv('UPLOAD_PARALLEL_CHUNKS', '1'))
+    UPLOAD_RESUME_ATTEMPTS = 5  # Attempts per upload, each resuming from the last acknowledged offset
+    
+    # Post-upload status tracking (Graph batch requests, per-video adaptive poll interval)
+    STATUS_POLL_INITIAL_SECONDS = 30
+    STATUS_POLL_MAX_SECONDS = 600
+    STATUS_GIVE_UP_MINUTES = 120  # Not published by then counts as a failure
+    STATUS_RUN_WAIT_MINUTES = 10  # Wait at the end of a run for its last videos to publish
+    PUBLISH_LOG_FILE = os.path.join(DATA_DIR, 'publish_times.jsonl')
+    
+    # Draft previews (python main.py preview)
+    DRAFT_SCALE = 0.5  # Fraction of OUTPUT_RESOLUTION
+    DRAFT_FPS = 12
+    DRAFT_CRF = 30
+    
+    # Encoder calibration (python main.py calibrate)
+    CALIBRATION_SECONDS = 20
+    CALIBRATION_PRESETS = ['ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium']
+    CALIBRATION_CRFS = [21, 23, 25]
+    CALIBRATION_THREADS = None  # None = 1, half and all cores plus auto
+    CALIBRATION_SSIM_TOLERANCE = 0.002  # Allowed SSIM drop vs medium/crf23
+    
     @classmethod
     def validate(cls):
         required = ['GROQ_API_KEY', 'PIXABAY_API_KEY', 'FACEBOOK_ACCESS_TOKEN', 'FACEBOOK_PAGE_ID']
         missing = [k for k in required if not getattr(cls, k)]
         if missing:
             raise ValueError(f"Missing: {', '.join(missing)}")
-        if not cls.VIDEO_URLS:
-            raise ValueError("No video URLs configured")
+        if not cls.VIDEO_URLS and not os.path.exists(cls.BACKGROUND_MANIFEST):
+            raise ValueError("No video URLs or background manifest configured")
         
         # Validate settings
         if cls.SUBTITLE_FONT_SIZE < 10 or cls.SUBTITLE_FONT_SIZE > 100:
@@ -73,9 +180,10 @@ class Config:
         # Create directories
         os.makedirs(cls.TEMP_DIR, exist_ok=True)
         os.makedirs(cls.DATA_DIR, exist_ok=True)
+        os.makedirs(cls.PROXY_DIR, exist_ok=True)
         
         logger.info(f"✓ Configuration validated")
-        logger.info(f"  Videos: {len(cls.VIDEO_URLS)} URLs")
+        logger.info(f"  Videos: {len(cls.VIDEO_URLS)} URLs (plus manifest {cls.BACKGROUND_MANIFEST})")
         logger.info(f"  Categories: {len(cls.CATEGORIES)}")
         logger.info(f"  Subtitle size: {cls.SUBTITLE_FONT_SIZE}px")
         logger.info(f"  Episode gap: {cls.EPISODE_GAP_MINUTES} minutes")
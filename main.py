@@ -1,19 +1,36 @@
 #!/usr/bin/env python3
+import argparse
 import os
+import queue
+import shutil
 import time
 import schedule
 from datetime import datetime
 from config import Config
-from utils.logger import setup_logger
+from utils.logger import setup_logger, set_log_context
 from utils.state_manager import StateManager
+from utils.media_probe import media_probe
+from utils.asset_cache import AssetCache
+from utils.http_client import http_client
+from utils.range_downloader import RangeDownloader
+from utils.workspace import Workspace
+from utils.artifact import Artifact
 from modules.story_generator import StoryGenerator
 from modules.voice_generator import VoiceGenerator
 from modules.subtitle_generator import SubtitleGenerator
 from modules.video_manager import VideoManager
+from modules.background_library import BackgroundLibrary
+from modules.proxy_cache import ProxyCache
 from modules.music_downloader import MusicDownloader
+from modules.music_library import MusicLibrary
+from modules.audio_mixer import AudioMixer
+from modules.loudness_analyzer import LoudnessAnalyzer
 from modules.video_assembler import VideoAssembler
 from modules.facebook_uploader import FacebookUploader
+from modules.upload_status_tracker import UploadStatusTracker
 from modules.episode_splitter import EpisodeSplitter
+from modules.encoder_calibration import EncoderCalibrator
+from modules.cache_warmer import CacheWarmer
 
 logger = setup_logger()
 
@@ -22,14 +39,36 @@ class ViralReelsBot:
         logger.info("Initializing bot...")
         Config.validate()
         
-        self.state_manager = StateManager(Config.STATE_FILE)
+        self.state_manager = StateManager(Config.STATE_DB, legacy_file=Config.STATE_FILE)
+        self.workspace = Workspace(Config)
+        self.workspace.gc()
         self.story_generator = StoryGenerator(Config.GROQ_API_KEY)
         self.voice_generator = VoiceGenerator(Config.TTS_VOICE)
         self.subtitle_generator = SubtitleGenerator(Config.GROQ_API_KEY)
-        self.video_manager = VideoManager(Config.VIDEO_URLS)
-        self.music_downloader = MusicDownloader(Config.PIXABAY_API_KEY, Config.FALLBACK_MUSIC_URL)
+        self.downloader = RangeDownloader(
+            Config.DOWNLOAD_CONNECTIONS, Config.DOWNLOAD_PART_BYTES, Config.DOWNLOAD_MIN_PARALLEL_BYTES
+        )
+        self.asset_cache = AssetCache(
+            Config.ASSET_CACHE_DIR, Config.ASSET_CACHE_MAX_BYTES, Config.ASSET_REVALIDATE_SECONDS,
+            downloader=self.downloader
+        )
+        self.background_library = BackgroundLibrary(Config)
+        self.video_manager = VideoManager(self.asset_cache)
+        self.proxy_cache = ProxyCache(Config)
+        self.music_library = MusicLibrary(
+            Config, self.asset_cache,
+            AudioMixer(Config) if Config.USE_NUMPY_MIXER else None,
+            LoudnessAnalyzer(Config) if Config.USE_LOUDNESS_PROFILES else None
+        )
+        self.music_downloader = MusicDownloader(self.music_library)
         self.video_assembler = VideoAssembler(Config)
-        self.facebook_uploader = FacebookUploader(Config.FACEBOOK_ACCESS_TOKEN, Config.FACEBOOK_PAGE_ID)
+        self.facebook_uploader = FacebookUploader(
+            Config.FACEBOOK_ACCESS_TOKEN, Config.FACEBOOK_PAGE_ID, Config.UPLOAD_BANDWIDTH_KBPS,
+            graph_url=Config.FACEBOOK_GRAPH_URL, chunk_size=Config.UPLOAD_CHUNK_BYTES,
+            parallel_chunks=Config.UPLOAD_PARALLEL_CHUNKS, resume_attempts=Config.UPLOAD_RESUME_ATTEMPTS
+        )
+        self.status_tracker = UploadStatusTracker(Config, on_failure=self._on_publish_failed)
+        self._publish_failures = queue.Queue()
         self.episode_splitter = EpisodeSplitter(target_words_per_episode=350)  # ~2 min episodes
         
         logger.info("Bot ready")
@@ -37,6 +76,7 @@ class ViralReelsBot:
     def run_pipeline(self):
         """Main pipeline - generates ONE story and posts ALL episodes with gaps"""
         run_id = datetime.now().strftime('%Y%m%d_%H%M%S')
+        set_log_context(run_id=run_id, episode=None, stage='story')
         logger.info(f"\n{'='*60}\nStarting run: {run_id}\n{'='*60}")
         
         try:
@@ -59,7 +99,9 @@ class ViralReelsBot:
             logger.info(f"{'='*60}\n")
             
             # Process each episode
+            retryable = {}  # episode id -> (episode, index), re-uploaded once if processing fails
             for episode_idx, episode in enumerate(episodes, 1):
+                self._reupload_failed(retryable, category, run_id)
                 logger.info(f"\n{'*'*50}")
                 logger.info(f"EPISODE {episode_idx}/{len(episodes)}")
                 logger.info(f"{'*'*50}\n")
@@ -74,6 +116,7 @@ class ViralReelsBot:
                 if not success:
                     logger.error(f"❌ Episode {episode_idx} failed, stopping run")
                     break
+                retryable[self._episode_id(run_id, episode_idx)] = (episode, episode_idx)
                 
                 # Wait 15 minutes between episodes (except after last one)
                 if episode_idx < len(episodes):
@@ -82,10 +125,14 @@ class ViralReelsBot:
                     logger.info(f"   Next episode at: {self._get_next_time(wait_seconds)}")
                     time.sleep(wait_seconds)
             
+            # Give the last uploads time to publish, so failures can still be re-uploaded
+            if not self.status_tracker.wait(Config.STATUS_RUN_WAIT_MINUTES * 60, prefix=run_id):
+                logger.warning(f"Still processing: {', '.join(self.status_tracker.pending(run_id))}")
+            self._reupload_failed(retryable, category, run_id)
+            
             # Update state after all episodes posted
             self.state_manager.increment_run_count()
             self.state_manager.update_last_run(run_id)
-            self.state_manager.save_state()
             
             logger.info(f"\n{'='*60}")
             logger.info(f"✓ RUN COMPLETED!")
@@ -104,65 +151,89 @@ class ViralReelsBot:
             import traceback
             logger.error("Full error traceback:")
             logger.error(traceback.format_exc())
+        
+        finally:
+            http_client.log_stats()
+            set_log_context(run_id=None, episode=None, stage=None)
+    
+    def _episode_id(self, run_id: str, episode_idx: int, retry: bool = False):
+        return f"{run_id}_ep{episode_idx}{'_retry' if retry else ''}"
+    
+    def _on_publish_failed(self, video_id: str, ep_id: str, reason: str):
+        """UploadStatusTracker callback (tracker thread): queue the episode for re-upload"""
+        self._publish_failures.put(ep_id)
+    
+    def _reupload_failed(self, retryable: dict, category: str, run_id: str):
+        """Render and upload again every episode of this run whose video failed processing"""
+        while True:
+            try:
+                ep_id = self._publish_failures.get_nowait()
+            except queue.Empty:
+                return
+            if ep_id not in retryable:
+                # Another run's episode, or already a re-upload
+                continue
+            episode, episode_idx = retryable.pop(ep_id)
+            logger.warning(f"Re-uploading episode {episode_idx}: Facebook failed to process it")
+            self._process_episode(episode, category, run_id, episode_idx, retry=True)
     
-    def _process_episode(self, episode: dict, category: str, run_id: str, episode_idx: int):
+    def _process_episode(self, episode: dict, category: str, run_id: str, episode_idx: int,
+                         retry: bool = False):
         """Process a single episode: generate video and upload"""
         
-        episode_story = episode['text']
-        episode_title = episode['title']
-        
-        # Define paths for this episode
-        ep_id = f"{run_id}_ep{episode_idx}"
-        audio_path = os.path.join(Config.TEMP_DIR, f'audio_{ep_id}.mp3')
-        video_path = os.path.join(Config.TEMP_DIR, f'video_{ep_id}.mp4')
-        music_path = os.path.join(Config.TEMP_DIR, f'music_{ep_id}.mp3')
-        subtitle_path = os.path.join(Config.TEMP_DIR, f'subs_{ep_id}.srt')
-        output_path = os.path.join(Config.TEMP_DIR, f'output_{ep_id}.mp4')
+        ep_id = self._episode_id(run_id, episode_idx, retry)
+        set_log_context(episode=ep_id, stage=None)
         
         try:
-            # Step 1: Generate voice
-            logger.info(f"[1/6] Generating voice narration...")
-            self.voice_generator.generate_voice(episode_story, audio_path)
-            
-            # Step 2: Generate subtitles
-            logger.info(f"[2/6] Generating Whisper-synced subtitles...")
-            self.subtitle_generator.generate_subtitles(audio_path, subtitle_path, episode_story)
-            
-            # Step 3: Download video
-            logger.info(f"[3/6] Downloading background video...")
-            video_index = self.state_manager.get_next_video_index(len(Config.VIDEO_URLS))
-            self.video_manager.download_video(video_index, video_path)
-            
-            # Step 4: Download music
-            logger.info(f"[4/6] Downloading background music...")
-            self.music_downloader.download_music(music_path)
-            
-            # Step 5: Assemble video
-            logger.info(f"[5/6] Assembling video...")
-            self.video_assembler.assemble_video(
-                video_path, audio_path, music_path, subtitle_path, 
-                output_path, episode_title
-            )
-            
-            # Step 6: Upload to Facebook
-            logger.info(f"[6/6] Uploading to Facebook...")
-            hashtags = self.facebook_uploader.generate_hashtags(category)
-            
-            # Generate episode-specific caption
-            caption_parts = self.episode_splitter.get_episode_caption(episode, category)
-            
-            upload_result = self.facebook_uploader.upload_episode(
-                video_path=output_path,
-                episode=episode,
-                caption_parts=caption_parts,
-                hashtags=hashtags
-            )
-            
-            logger.info(f"✓ Episode {episode_idx} uploaded! Video ID: {upload_result.get('video_id')}")
-            
-            # Cleanup this episode's files
-            self._cleanup_temp_files([audio_path, video_path, music_path, subtitle_path, output_path])
-            logger.info(f"✓ Episode {episode_idx} temp files cleaned")
+            with self.workspace.episode(ep_id) as work_dir:
+                paths = self._episode_paths(work_dir, ep_id)
+                try:
+                    hashtags = self.facebook_uploader.generate_hashtags(category)
+                    
+                    # Generate episode-specific caption
+                    caption_parts = self.episode_splitter.get_episode_caption(episode, category)
+                    
+                    progressive = None
+                    if Config.PROGRESSIVE_UPLOAD:
+                        try:
+                            progressive = self.facebook_uploader.start_progressive_upload()
+                        except Exception as e:
+                            logger.warning(f"Could not open a progressive upload session ({e}), "
+                                           f"uploading after the render instead")
+                    
+                    if progressive:
+                        # Steps 5+6 overlap: fragments are uploaded while they are encoded
+                        try:
+                            self._render_episode(episode, paths, category, fragment_sink=progressive.feed)
+                        except Exception:
+                            progressive.abort()
+                            raise
+                        set_log_context(stage='upload')
+                        logger.info(f"[6/6] Finishing Facebook upload...")
+                        upload_result = self.facebook_uploader.finish_progressive_upload(
+                            progressive, paths['output'], episode, caption_parts, hashtags
+                        )
+                    else:
+                        self._render_episode(episode, paths, category)
+                    
+                        # Step 6: Upload to Facebook
+                        set_log_context(stage='upload')
+                        logger.info(f"[6/6] Uploading to Facebook...")
+                        upload_result = self.facebook_uploader.upload_episode(
+                            video_path=paths['output'],
+                            episode=episode,
+                            caption_parts=caption_parts,
+                            hashtags=hashtags
+                        )
+                    
+                    logger.info(f"✓ Episode {episode_idx} uploaded! Video ID: {upload_result.get('video_id')}")
+                    if upload_result.get('video_id'):
+                        self.status_tracker.track(upload_result['video_id'], ep_id)
+                    self._keep_variants(paths['output'])
+                finally:
+                    # Also on failure; the workspace removes anything else left behind
+                    self._cleanup_temp_files(self._episode_files(paths))
+                    logger.info(f"✓ Episode {episode_idx} temp files cleaned")
             
             return True
             
@@ -172,9 +243,152 @@ class ViralReelsBot:
             logger.error(traceback.format_exc())
             return False
     
+    def _episode_paths(self, work_dir: str, ep_id: str):
+        """Define paths for one episode"""
+        return {
+            'audio': os.path.join(work_dir, f'audio_{ep_id}.mp3'),
+            'video': os.path.join(work_dir, f'video_{ep_id}.mp4'),
+            'music': os.path.join(work_dir, f'music_{ep_id}.mp3'),
+            'subtitles': os.path.join(work_dir, f'subs_{ep_id}.srt'),
+            'output': os.path.join(work_dir, f'output_{ep_id}.mp4'),
+        }
+    
+    def _episode_files(self, paths: dict):
+        """Every file an episode may leave behind"""
+        files = list(paths.values())
+        files.append(paths['output'] + '.upload.json')  # ResumableUpload state
+        files += [self.video_assembler.variant_output_path(paths['output'], v) for v in Config.OUTPUT_VARIANTS]
+        return files
+    
+    def _render_episode(self, episode: dict, paths: dict, category: str = None, draft: bool = False,
+                        max_seconds: float = None, fragment_sink=None):
+        """Steps 1-5: voice, subtitles, background, music and assembly"""
+        episode_story = episode['text']
+        episode_title = episode['title']
+        # Voice and subtitles stay in memory unless a consumer needs a file
+        audio_path = Artifact(paths['audio'], Config.ARTIFACT_SPILL_BYTES)
+        video_path = paths['video']
+        music_path = paths['music']
+        subtitle_path = Artifact(paths['subtitles'], Config.ARTIFACT_SPILL_BYTES)
+        output_path = paths['output']
+        
+        # Step 1: Generate voice
+        set_log_context(stage='voice')
+        logger.info(f"[1/6] Generating voice narration...")
+        self.voice_generator.generate_voice(episode_story, audio_path)
+        
+        # Step 2: Generate subtitles
+        set_log_context(stage='subtitles')
+        logger.info(f"[2/6] Generating Whisper-synced subtitles...")
+        self.subtitle_generator.generate_subtitles(audio_path, subtitle_path, episode_story)
+        
+        # Step 3: Download video
+        set_log_context(stage='background')
+        logger.info(f"[3/6] Downloading background video...")
+        needed = media_probe.get_duration(audio_path)
+        if max_seconds:
+            needed = min(needed, max_seconds)
+        clip = self.background_library.pick(needed, category)
+        background_path, background_key = self._get_background(clip, video_path)
+        
+        # Step 4: Download music
+        set_log_context(stage='music')
+        logger.info(f"[4/6] Picking background music...")
+        music_path = self.music_downloader.download_music(music_path)
+        
+        # Step 5: Assemble video
+        set_log_context(stage='render')
+        logger.info(f"[5/6] Assembling video...")
+        self.video_assembler.assemble_video(
+            background_path, audio_path, music_path, subtitle_path, 
+            output_path, episode_title,
+            variants=None if draft else Config.OUTPUT_VARIANTS,
+            draft=draft, max_seconds=max_seconds, fragment_sink=fragment_sink, video_key=background_key
+        )
+        return output_path
+    
+    def preview(self, category: str = None, max_seconds: float = None):
+        """
+        Render a draft of the first episode for a category into PREVIEW_DIR
+        
+        Nothing is uploaded and no state is saved, so prompts, font sizes and
+        subtitle styles can be checked in seconds.
+        """
+        # Peek only: a preview must not use up a category of the production rotation
+        category = category or self.state_manager.peek_next_category(Config.CATEGORIES)
+        preview_id = f"preview_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        set_log_context(run_id=preview_id, stage='preview')
+        logger.info(f"Rendering draft preview for '{category}' ({preview_id})")
+        
+        story_data = self.story_generator.generate_story(category)
+        episodes = self.episode_splitter.split_story(story_data['story'], story_data['title'])
+        
+        os.makedirs(Config.PREVIEW_DIR, exist_ok=True)
+        with self.workspace.episode(preview_id) as work_dir:
+            paths = self._episode_paths(work_dir, preview_id)
+            # Keep only the preview video (and its subtitles for inspection)
+            preview_paths = self._episode_paths(Config.PREVIEW_DIR, preview_id)
+            paths['output'], paths['subtitles'] = preview_paths['output'], preview_paths['subtitles']
+            keep = (paths['output'], paths['subtitles'])
+            try:
+                output_path = self._render_episode(episodes[0], paths, category, draft=True, max_seconds=max_seconds)
+            finally:
+                self._cleanup_temp_files([p for p in self._episode_files(paths) if p not in keep])
+        logger.info(f"✓ Preview ready: {output_path}")
+        return output_path
+    
+    def warmup(self):
+        """Fetch and pre-process every background and music asset (see CacheWarmer)"""
+        set_log_context(stage='warmup')
+        result = CacheWarmer(Config, self).run()
+        http_client.log_stats()
+        return result
+    
+    def _get_background(self, clip: dict, video_path: str):
+        """
+        Return the proxy for a background, transcoding it on first use
+        
+        Returns:
+            tuple: (path, content key of the clip, or None for a proxy); the
+                key locates the clip's keyframe index, which outlives the
+                per-episode link
+        """
+        # Cached and revalidated: no network bytes unless the clip changed
+        video_path = self.video_manager.download_video(clip['url'], video_path, clip.get('sha256'))
+        content_key = self.video_manager.content_key(clip['url'])
+        if 'duration' not in clip:
+            self.background_library.learn(clip['url'], video_path, self.video_assembler.keyframe_index,
+                                          content_key)
+        if not Config.USE_VIDEO_PROXIES:
+            return video_path, content_key
+        
+        # Proxies are keyed by content, so a changed clip gets a new proxy
+        proxy_path = self.proxy_cache.get(content_key)
+        if proxy_path:
+            return proxy_path, None
+        
+        try:
+            return self.proxy_cache.build(content_key, video_path), None
+        except Exception as e:
+            logger.warning(f"Proxy build failed, using original clip: {e}")
+            return video_path, content_key
+    
+    def _keep_variants(self, output_path: str):
+        """Move the rendered output variants out of the workspace into VARIANTS_DIR"""
+        for variant in Config.OUTPUT_VARIANTS:
+            path = self.video_assembler.variant_output_path(output_path, variant)
+            if not os.path.exists(path):
+                continue
+            os.makedirs(Config.VARIANTS_DIR, exist_ok=True)
+            target = os.path.join(Config.VARIANTS_DIR, os.path.basename(path))
+            # The workspace may be on tmpfs, so this can be a copy
+            shutil.move(path, target)
+            logger.info(f"✓ Variant '{variant['name']}' kept: {target}")
+    
     def _cleanup_temp_files(self, files: list):
         """Clean up temporary files after successful upload"""
         for file_path in files:
+            media_probe.invalidate(file_path)
             try:
                 if os.path.exists(file_path):
                     os.remove(file_path)
@@ -204,5 +418,22 @@ class ViralReelsBot:
             logger.info("Bot stopped")
 
 if __name__ == "__main__":
-    bot = ViralReelsBot()
-    bot.start_scheduler()
+    parser = argparse.ArgumentParser(description="Viral Reels Bot")
+    parser.add_argument('command', nargs='?', default='run', choices=['run', 'calibrate', 'preview', 'warmup'],
+                        help="run: start the scheduler (default); calibrate: benchmark encoder settings "
+                             "for this host; preview: draft-render one episode without uploading; "
+                             "warmup: pre-fetch and pre-process all backgrounds and music")
+    parser.add_argument('--category', help="preview: category to render (default: next in rotation)")
+    parser.add_argument('--seconds', type=float, help="preview: only render the first N seconds")
+    args = parser.parse_args()
+    
+    if args.command == 'calibrate':
+        EncoderCalibrator(Config).run()
+    elif args.command == 'preview':
+        ViralReelsBot().preview(category=args.category, max_seconds=args.seconds)
+    elif args.command == 'warmup':
+        result = ViralReelsBot().warmup()
+        raise SystemExit(1 if result['failed'] else 0)
+    else:
+        bot = ViralReelsBot()
+        bot.start_scheduler()
@@ -0,0 +1,187 @@
+import hashlib
+import os
+import subprocess
+import time
+import numpy as np
+from utils import pcm
+from utils.artifact import Artifact, as_path
+from utils.logger import setup_logger
+
+logger = setup_logger()
+
+
+class AudioMixer:
+    """Mixes narration and music in-process with sidechain ducking"""
+
+    SAMPLE_RATE = pcm.SAMPLE_RATE
+    CHANNELS = pcm.CHANNELS
+    FRAME_MS = 10  # Envelope resolution
+
+    def __init__(self, config):
+        self.config = config
+        self.cache_dir = config.MIX_CACHE_DIR
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def mix(self, voice_path: str, music_path: str, voice_gain: float = None, music_gain: float = None) -> str:
+        """
+        Build the final soundtrack (AAC, ready to mux with -c:a copy)
+
+        The result is cached by the content of both inputs plus the mix
+        settings, so a video-only re-render of an episode skips all audio work.
+
+        Args:
+            voice_path: Narration audio (path or Artifact)
+            music_path: Background music (looped to the narration length)
+            voice_gain: Linear narration gain (default VOICE_VOLUME_BOOST)
+            music_gain: Linear music gain before ducking (default MUSIC_VOLUME)
+
+        Returns:
+            str: Path to mixed .m4a
+        """
+        voice_gain = self.config.VOICE_VOLUME_BOOST if voice_gain is None else voice_gain
+        music_gain = self.config.MUSIC_VOLUME if music_gain is None else music_gain
+        cache_key = self._cache_key(voice_path, music_path, voice_gain, music_gain)
+        output_path = os.path.join(self.cache_dir, f"mix_{cache_key}.m4a")
+        if os.path.exists(output_path):
+            logger.info(f"✓ Using cached mix: {output_path}")
+            return output_path
+
+        self._prune_cache()
+        start = time.perf_counter()
+
+        voice = self._decode(voice_path)
+        music = self._decode(music_path)
+        if len(voice) == 0:
+            raise ValueError(f"Voice track is empty: {voice_path}")
+
+        bed = self._build_bed(music, len(voice))
+        duck_gain = self._ducking_gain(voice)
+
+        mixed = voice * voice_gain + bed * (music_gain * duck_gain)[:, None]
+
+        # Keep headroom instead of hard clipping
+        peak = float(np.max(np.abs(mixed))) if len(mixed) else 0.0
+        if peak > 0.98:
+            mixed *= 0.98 / peak
+
+        self._encode(mixed, output_path)
+        logger.info(
+            f"✓ Mixed soundtrack in {time.perf_counter() - start:.2f}s "
+            f"({len(voice) / self.SAMPLE_RATE:.2f}s audio, music ducked "
+            f"{self.config.DUCKING_DB:.0f}dB under speech)"
+        )
+        return output_path
+
+    def predecode(self, path: str) -> str:
+        """
+        Store the decoded PCM of a long-lived asset next to it (<path>.pcm.npy)
+
+        _decode memory-maps the sidecar instead of running ffmpeg, so library
+        tracks are decoded once rather than on every mix.
+        """
+        pcm_path = self.pcm_path(path)
+        if not self._has_fresh_pcm(path):
+            tmp_path = pcm_path + '.tmp.npy'
+            np.save(tmp_path, self._decode(path))
+            os.replace(tmp_path, pcm_path)
+        return pcm_path
+
+    def pcm_path(self, path: str) -> str:
+        return path + '.pcm.npy'
+
+    def _has_fresh_pcm(self, path: str) -> bool:
+        pcm_path = self.pcm_path(path)
+        return os.path.exists(pcm_path) and os.path.getmtime(pcm_path) >= os.path.getmtime(path)
+
+    def _decode(self, path: str) -> np.ndarray:
+        """Decode any input (path or Artifact) to float32 PCM, shape (samples, channels)"""
+        if not isinstance(path, Artifact) and self._has_fresh_pcm(path):
+            return np.load(self.pcm_path(path), mmap_mode='r')
+        return pcm.decode_pcm(path)
+
+    def _encode(self, samples: np.ndarray, output_path: str):
+        tmp_path = output_path + '.tmp.m4a'
+        cmd = [
+            'ffmpeg', '-y', '-v', 'error',
+            '-f', 'f32le', '-ar', str(self.SAMPLE_RATE), '-ac', str(self.CHANNELS),
+            '-i', 'pipe:0',
+            '-c:a', 'aac', '-b:a', f"{self.config.AUDIO_BITRATE_KBPS}k", '-ar', str(self.SAMPLE_RATE),
+            tmp_path
+        ]
+        subprocess.run(cmd, input=np.ascontiguousarray(samples, dtype=np.float32).tobytes(),
+                       capture_output=True, check=True)
+        os.replace(tmp_path, output_path)
+
+    def _build_bed(self, music: np.ndarray, length: int) -> np.ndarray:
+        """Loop music to length, crossfading the tail into the head at each seam"""
+        if len(music) == 0:
+            return np.zeros((length, self.CHANNELS), dtype=np.float32)
+
+        xfade = min(int(self.config.MUSIC_CROSSFADE_MS * self.SAMPLE_RATE / 1000), len(music) // 4)
+        if xfade > 0 and len(music) < length:
+            ramp = np.linspace(0.0, 1.0, xfade, dtype=np.float32)[:, None]
+            unit = music[:-xfade].copy()
+            unit[:xfade] = music[:xfade] * ramp + music[-xfade:] * (1.0 - ramp)
+        else:
+            unit = music
+
+        repeats = -(-length // len(unit))
+        return np.tile(unit, (repeats, 1))[:length]
+
+    def _ducking_gain(self, voice: np.ndarray) -> np.ndarray:
+        """
+        Per-sample music gain from a vectorised speech-energy envelope
+
+        Frames above the speech threshold are held for the release time
+        (sliding max) and the resulting dB curve is smoothed over the attack
+        time (moving average), then interpolated back to sample rate.
+        """
+        hop = self.SAMPLE_RATE * self.FRAME_MS // 1000
+        mono = voice.mean(axis=1)
+        n_frames = -(-len(mono) // hop)
+        padded = np.zeros(n_frames * hop, dtype=np.float32)
+        padded[:len(mono)] = mono
+
+        rms = np.sqrt(np.mean(padded.reshape(n_frames, hop) ** 2, axis=1))
+        level_db = 20 * np.log10(np.maximum(rms, 1e-9))
+        speech = (level_db > self.config.DUCKING_THRESHOLD_DB).astype(np.float32)
+
+        release = max(1, self.config.DUCKING_RELEASE_MS // self.FRAME_MS)
+        held = np.lib.stride_tricks.sliding_window_view(
+            np.concatenate([np.zeros(release - 1, dtype=np.float32), speech]), release
+        ).max(axis=1)
+
+        attack = max(1, self.config.DUCKING_ATTACK_MS // self.FRAME_MS)
+        smooth = np.convolve(held, np.ones(attack, dtype=np.float32) / attack, mode='same')
+
+        gain = np.power(10.0, self.config.DUCKING_DB * smooth / 20.0).astype(np.float32)
+        frame_centers = np.arange(n_frames) * hop + hop / 2
+        return np.interp(np.arange(len(mono)), frame_centers, gain).astype(np.float32)
+
+    def _cache_key(self, voice_path: str, music_path: str, voice_gain: float, music_gain: float) -> str:
+        digest = hashlib.sha1()
+        for path in (voice_path, music_path):
+            if isinstance(path, Artifact) and path.in_memory:
+                digest.update(path.getvalue())
+                continue
+            with open(as_path(path), 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+        settings = (
+            round(voice_gain, 4), round(music_gain, 4), self.config.DUCKING_DB,
+            self.config.DUCKING_THRESHOLD_DB, self.config.DUCKING_ATTACK_MS,
+            self.config.DUCKING_RELEASE_MS, self.config.MUSIC_CROSSFADE_MS, self.config.AUDIO_BITRATE_KBPS
+        )
+        digest.update(repr(settings).encode('utf-8'))
+        return digest.hexdigest()[:16]
+
+    def _prune_cache(self):
+        """Drop mixes older than MIX_CACHE_MAX_AGE_HOURS"""
+        cutoff = time.time() - self.config.MIX_CACHE_MAX_AGE_HOURS * 3600
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
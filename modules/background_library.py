@@ -0,0 +1,179 @@
+import bisect
+import json
+import math
+import os
+import random
+import threading
+from utils.logger import setup_logger
+from utils.media_probe import media_probe
+
+logger = setup_logger()
+
+
+class BackgroundLibrary:
+    """
+    Manifest of background clips with precomputed metadata
+
+    The manifest (BACKGROUND_MANIFEST) is a JSON file of the form
+    {"clips": [{"url": ..., "duration": 63.2, "width": 1080, "height": 1920,
+    "fps": 30, "keyframe_interval": 2.0, "tags": ["horror"]}, ...]}.
+    VIDEO_URL_n environment variables are merged in as untagged clips.
+    Metadata that is missing is learned the first time a clip is used. An
+    optional "sha256" is verified when the clip is downloaded.
+
+    The manifest is only read on first use, and selection goes through a
+    duration index: per tag, clips are sorted by duration with a table of
+    where each DURATION_BUCKET_SECONDS bucket starts, so "a clip at least N
+    seconds long" is a table lookup plus one random index.
+    """
+
+    UNTAGGED = '*'
+
+    def __init__(self, config):
+        self.config = config
+        self.manifest_path = config.BACKGROUND_MANIFEST
+        self.bucket_seconds = config.DURATION_BUCKET_SECONDS
+        self._lock = threading.Lock()
+        self._clips = None  # url -> clip, loaded lazily
+        self._index = None  # tag -> (clips sorted by duration, bucket start table)
+
+    def pick(self, min_duration: float = 0.0, category: str = None) -> dict:
+        """
+        Pick a random clip at least min_duration long, preferring the category
+
+        Clips of unknown duration count as long enough. If nothing is long
+        enough, any clip is used (the renderer loops short backgrounds).
+
+        Returns:
+            dict: Clip entry (url plus whatever metadata is known)
+        """
+        index = self._get_index()
+        if not index:
+            raise ValueError("No background clips configured")
+
+        preferences = [(category, self.UNTAGGED), (None,)] if category else [(None,)]
+        for tags in preferences:
+            clip = self._pick_from(index, tags, min_duration)
+            if clip:
+                return clip
+
+        logger.warning(f"No background is {min_duration:.0f}s long, using a shorter clip (it will loop)")
+        return self._pick_from(index, (None,), 0.0)
+
+    def clips(self) -> list:
+        """Every clip in the library"""
+        return list(self._load().values())
+
+    def record(self, url: str, **metadata):
+        """Store learned metadata for a clip and persist the manifest"""
+        clips = self._load()
+        with self._lock:
+            clip = clips.setdefault(url, {'url': url, 'tags': []})
+            changed = any(clip.get(k) != v for k, v in metadata.items())
+            clip.update(metadata)
+            if changed:
+                self._index = None
+                self._save()
+
+    def learn(self, url: str, video_path: str, keyframe_index=None, key: str = None):
+        """Record a clip's metadata from its downloaded file (key: its content hash)"""
+        try:
+            info = media_probe.probe(video_path)
+            metadata = {
+                'duration': info['duration'],
+                'width': info['width'],
+                'height': info['height'],
+                'fps': info['fps'],
+            }
+            if keyframe_index:
+                keyframes = keyframe_index.get(video_path, key)
+                if len(keyframes) > 1:
+                    metadata['keyframe_interval'] = round(keyframes[-1] / (len(keyframes) - 1), 3)
+            self.record(url, **metadata)
+        except Exception as e:
+            logger.warning(f"Could not record background metadata for {url}: {e}")
+
+    def _pick_from(self, index, tags, min_duration):
+        # Bucket floor; the few clips below min_duration in that bucket are skipped
+        bucket = int(min_duration // self.bucket_seconds)
+        ranges = []
+        for tag in tags:
+            if tag not in index:
+                continue
+            clips, starts = index[tag]
+            # Past the table only clips of unknown duration are left
+            first = starts[min(bucket, len(starts) - 1)]
+            ranges.append((clips, first))
+
+        total = sum(len(clips) - first for clips, first in ranges)
+        for _ in range(8):
+            if total <= 0:
+                return None
+            i = random.randrange(total)
+            for clips, first in ranges:
+                if i < len(clips) - first:
+                    clip = clips[first + i]
+                    break
+                i -= len(clips) - first
+            if self._duration(clip) >= min_duration:
+                return clip
+        # Unlucky draws from the partial bucket: take the longest candidate
+        return max((clips[-1] for clips, first in ranges if first < len(clips)), key=self._duration)
+
+    def _get_index(self):
+        with self._lock:
+            if self._index is not None:
+                return self._index
+
+        clips = self._load()
+        by_tag = {}
+        for clip in clips.values():
+            for tag in clip.get('tags') or [self.UNTAGGED]:
+                by_tag.setdefault(tag, []).append(clip)
+            by_tag.setdefault(None, []).append(clip)
+
+        index = {}
+        for tag, tagged in by_tag.items():
+            tagged.sort(key=self._duration)
+            durations = [self._duration(c) for c in tagged]
+            finite = [d for d in durations if math.isfinite(d)]
+            n_buckets = int(max(finite, default=0) // self.bucket_seconds) + 2
+            # starts[b] = first clip with duration >= b * bucket_seconds
+            starts = [bisect.bisect_left(durations, b * self.bucket_seconds) for b in range(n_buckets)]
+            index[tag] = (tagged, starts)
+
+        with self._lock:
+            self._index = index
+        return index
+
+    def _duration(self, clip):
+        duration = clip.get('duration')
+        return float(duration) if duration else math.inf
+
+    def _load(self):
+        with self._lock:
+            if self._clips is not None:
+                return self._clips
+
+            clips = {}
+            if os.path.exists(self.manifest_path):
+                try:
+                    with open(self.manifest_path, 'r') as f:
+                        for clip in json.load(f).get('clips', []):
+                            clips[clip['url']] = clip
+                except Exception as e:
+                    logger.error(f"Background manifest unreadable: {e}")
+
+            for url in self.config.VIDEO_URLS:
+                clips.setdefault(url, {'url': url, 'tags': []})
+
+            logger.info(f"Background library: {len(clips)} clips")
+            self._clips = clips
+            return clips
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.manifest_path) or '.', exist_ok=True)
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'clips': list(self._clips.values())}, f, indent=1)
+        os.replace(tmp_path, self.manifest_path)
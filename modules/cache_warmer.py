@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.http_client import http_client
+from utils.logger import setup_logger, with_log_context
+from utils.media_probe import media_probe
+
+logger = setup_logger()
+
+
+class CacheWarmer:
+    """
+    Pre-fetches and pre-processes every asset the render path uses
+
+    For each background: fetch into the asset cache, probe, record its
+    metadata in the manifest, build the proxy and its keyframe index. For
+    music: refresh the library (fetch, extract, pre-decode, loudness). All
+    of it runs under one concurrency cap so a new node is warm before it
+    posts its first episode.
+    """
+
+    def __init__(self, config, bot):
+        self.config = config
+        self.bot = bot
+        self.concurrency = config.WARMUP_CONCURRENCY
+        self.work_dir = os.path.join(config.TEMP_DIR, 'warmup')
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def run(self) -> dict:
+        """
+        Warm everything
+
+        Returns:
+            dict: counts of warmed and failed assets, bytes fetched, seconds
+        """
+        clips = self.bot.background_library.clips()
+        os.makedirs(self.work_dir, exist_ok=True)
+        logger.info(f"Warming {len(clips)} backgrounds + music library "
+                    f"({self.concurrency} at a time)...")
+
+        bytes_before = self._bytes_received()
+        start = time.perf_counter()
+        done = failed = 0
+        total = len(clips) + 1
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = {pool.submit(with_log_context(self._warm_music)): 'music library'}
+            for i, clip in enumerate(clips):
+                futures[pool.submit(with_log_context(self._warm_background), clip, i)] = clip['url']
+
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    detail = future.result()
+                    done += 1
+                    logger.info(f"[{done + failed}/{total}] ✓ {name} ({detail})")
+                except Exception as e:
+                    failed += 1
+                    logger.error(f"[{done + failed}/{total}] ❌ {name}: {e}")
+
+        elapsed = time.perf_counter() - start
+        fetched = self._bytes_received() - bytes_before
+        logger.info(
+            f"✓ Warm-up finished in {elapsed:.1f}s: {done} ok, {failed} failed, "
+            f"{fetched / 1024 / 1024:.1f}MB fetched ({fetched / 1024 / 1024 / max(elapsed, 1e-6):.1f}MB/s, "
+            f"{done / max(elapsed, 1e-6) * 60:.1f} assets/min)"
+        )
+        return {'warmed': done, 'failed': failed, 'bytes': fetched, 'seconds': elapsed}
+
+    def _warm_background(self, clip, i):
+        start = time.perf_counter()
+        url = clip['url']
+        # Same hardlink layout as an episode, cleaned up afterwards
+        video_path = os.path.join(self.work_dir, f"warm_{i}.mp4")
+        keyframe_index = self.bot.video_assembler.keyframe_index
+        try:
+            video_path = self.bot.video_manager.download_video(url, video_path, clip.get('sha256'))
+            key = self.bot.video_manager.content_key(url)
+            info = media_probe.probe(video_path)
+            if 'duration' not in clip:
+                self.bot.background_library.learn(url, video_path, keyframe_index, key)
+
+            proxy_note = "no proxy, keyframes"
+            if not self.config.USE_VIDEO_PROXIES:
+                keyframe_index.get(video_path, key)
+            else:
+                # URLs with identical content share one proxy: build it once
+                with self._lock:
+                    key_lock = self._key_locks.setdefault(key, threading.Lock())
+                with key_lock:
+                    proxy_path = self.bot.proxy_cache.get(key) or self.bot.proxy_cache.build(key, video_path)
+                    keyframe_index.get(proxy_path)
+                proxy_note = "proxy + keyframes"
+        finally:
+            # Only remove our hardlink, never the cache object it may fall back to
+            # (the keyframe index is kept by content key, next to the object)
+            if video_path.startswith(self.work_dir):
+                for path in (video_path, keyframe_index.index_path(video_path)):
+                    media_probe.invalidate(path)
+                    if os.path.exists(path):
+                        os.remove(path)
+
+        return f"{info['duration']:.0f}s {info['width']}x{info['height']}, {proxy_note}, " \
+               f"{time.perf_counter() - start:.1f}s"
+
+    def _warm_music(self):
+        start = time.perf_counter()
+        self.bot.music_library.refresh()
+        return f"{len(self.bot.music_library.tracks())} tracks, {time.perf_counter() - start:.1f}s"
+
+    def _bytes_received(self):
+        return sum(s['bytes_received'] for s in http_client.stats().values())
@@ -0,0 +1,196 @@
+import json
+import os
+import re
+import resource
+import shutil
+import socket
+import subprocess
+import time
+from datetime import datetime
+from modules.video_assembler import VideoAssembler
+from utils.logger import setup_logger
+
+logger = setup_logger()
+
+# The profile VideoAssembler used before calibration existed
+BASELINE_PROFILE = {'preset': 'medium', 'crf': 23, 'threads': 0}
+
+
+class EncoderCalibrator:
+    """Benchmarks encoder settings on a synthetic episode and picks a per-host profile"""
+
+    def __init__(self, config):
+        self.config = config
+        self.work_dir = os.path.join(config.TEMP_DIR, 'calibration')
+        self.duration = config.CALIBRATION_SECONDS
+
+    def run(self):
+        """
+        Render the synthetic episode across the preset/CRF/thread grid and
+        save the fastest profile that keeps the baseline quality
+
+        Returns:
+            dict: Chosen profile (also written to the host's profile file)
+        """
+        os.makedirs(self.work_dir, exist_ok=True)
+        try:
+            video_path, audio_path, music_path, subtitle_path = self._make_sample_episode()
+
+            # Lossless render of the same graph is the quality reference
+            reference_path = os.path.join(self.work_dir, 'reference.mp4')
+            self._render(video_path, audio_path, music_path, subtitle_path, reference_path,
+                         {'preset': 'ultrafast', 'crf': 0, 'threads': 0})
+
+            grid = self._build_grid()
+            logger.info(f"Calibrating {len(grid)} encoder profiles on a {self.duration}s synthetic episode")
+
+            results = []
+            for i, profile in enumerate(grid, 1):
+                output_path = os.path.join(self.work_dir, 'candidate.mp4')
+                result = self._render(video_path, audio_path, music_path, subtitle_path, output_path, profile)
+                result['ssim'] = self._measure_ssim(output_path, reference_path)
+                results.append(result)
+                logger.info(
+                    f"  [{i}/{len(grid)}] preset={profile['preset']} crf={profile['crf']} "
+                    f"threads={profile['threads'] or 'auto'}: {result['wall_seconds']:.2f}s wall, "
+                    f"{result['fps']:.1f}fps, {result['cpu_seconds']:.2f} CPU-s, "
+                    f"{result['size_bytes'] / 1024:.0f}KB, SSIM {result['ssim']:.4f}"
+                )
+
+            chosen = self._choose(results)
+            self._save_profile(chosen, results)
+            return chosen
+        finally:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def _build_grid(self):
+        cpus = os.cpu_count() or 1
+        threads = self.config.CALIBRATION_THREADS or sorted({0, 1, max(1, cpus // 2), cpus})
+
+        grid = [
+            {'preset': preset, 'crf': crf, 'threads': t}
+            for preset in self.config.CALIBRATION_PRESETS
+            for crf in self.config.CALIBRATION_CRFS
+            for t in threads
+        ]
+        if BASELINE_PROFILE not in grid:
+            grid.insert(0, dict(BASELINE_PROFILE))
+        return grid
+
+    def _choose(self, results):
+        """Fastest profile whose SSIM is within tolerance of the baseline's"""
+        baseline = next(r for r in results if r['profile'] == BASELINE_PROFILE)
+        target = baseline['ssim'] - self.config.CALIBRATION_SSIM_TOLERANCE
+
+        eligible = [r for r in results if r['ssim'] >= target] or [baseline]
+        best = max(eligible, key=lambda r: r['fps'])
+
+        speedup = best['fps'] / baseline['fps'] if baseline['fps'] else 0
+        logger.info(
+            f"✓ Chosen profile: preset={best['profile']['preset']} crf={best['profile']['crf']} "
+            f"threads={best['profile']['threads'] or 'auto'} "
+            f"({best['fps']:.1f}fps, {speedup:.2f}x baseline, SSIM {best['ssim']:.4f} >= {target:.4f})"
+        )
+        return best
+
+    def _render(self, video_path, audio_path, music_path, subtitle_path, output_path, profile):
+        """Render with the real assembler graph and measure wall time, CPU time and size"""
+        assembler = VideoAssembler(self.config)
+        assembler.encoding_profile = profile
+        # Compare the profiles themselves: an uplink bitrate cap would also cap
+        # the crf 0 reference, and SSIM would only measure the cap
+        assembler.upload_video_kbps = None
+
+        usage_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        start = time.perf_counter()
+        assembler._render_single(video_path, audio_path, music_path, subtitle_path,
+                                 output_path, "Calibration Episode", self.duration)
+        wall = time.perf_counter() - start
+        usage_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+        cpu = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+        frames = self.duration * self.config.PROXY_FPS
+        return {
+            'profile': profile,
+            'wall_seconds': wall,
+            'cpu_seconds': cpu,
+            'fps': frames / wall if wall > 0 else 0.0,
+            'size_bytes': os.path.getsize(output_path),
+        }
+
+    def _measure_ssim(self, output_path, reference_path):
+        cmd = [
+            'ffmpeg', '-i', output_path, '-i', reference_path,
+            '-lavfi', '[0:v][1:v]ssim', '-f', 'null', '-'
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        match = re.search(r'All:([0-9.]+)', result.stderr)
+        return float(match.group(1)) if match else 0.0
+
+    def _make_sample_episode(self):
+        """Generate background, voice, music and SRT with lavfi sources"""
+        if self.config.USE_VIDEO_PROXIES:
+            # Production renders read proxies, so calibrate on the same input
+            width, height = self.config.OUTPUT_RESOLUTION
+        else:
+            width, height = 1280, 720
+
+        video_path = os.path.join(self.work_dir, 'background.mp4')
+        audio_path = os.path.join(self.work_dir, 'voice.mp3')
+        music_path = os.path.join(self.work_dir, 'music.mp3')
+        subtitle_path = os.path.join(self.work_dir, 'subs.srt')
+        seconds = str(self.duration)
+
+        # testsrc2 + noise gives the encoder real motion and texture to work on
+        subprocess.run([
+            'ffmpeg', '-y', '-f', 'lavfi',
+            '-i', f"testsrc2=size={width}x{height}:rate={self.config.PROXY_FPS}",
+            '-vf', 'noise=alls=12:allf=t', '-t', seconds,
+            '-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '18', '-pix_fmt', 'yuv420p',
+            video_path
+        ], capture_output=True, text=True, check=True)
+
+        subprocess.run([
+            'ffmpeg', '-y', '-f', 'lavfi', '-i', 'sine=frequency=220:sample_rate=24000',
+            '-t', seconds, '-c:a', 'libmp3lame', '-b:a', '48k', audio_path
+        ], capture_output=True, text=True, check=True)
+
+        subprocess.run([
+            'ffmpeg', '-y', '-f', 'lavfi', '-i', 'anoisesrc=color=pink:amplitude=0.2',
+            '-t', '7', '-c:a', 'libmp3lame', '-b:a', '128k', music_path
+        ], capture_output=True, text=True, check=True)
+
+        # One 4-word cue every 1.5 seconds, like the Whisper chunks
+        cues = []
+        t = 0.0
+        while t + 1.5 <= self.duration:
+            cues.append(
+                f"{len(cues) + 1}\n{self._srt_time(t)} --> {self._srt_time(t + 1.4)}\n"
+                f"calibration cue number {len(cues) + 1}\n"
+            )
+            t += 1.5
+        with open(subtitle_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(cues))
+
+        return video_path, audio_path, music_path, subtitle_path
+
+    def _srt_time(self, seconds):
+        ms = int(round(seconds * 1000))
+        h, ms = divmod(ms, 3600000)
+        m, ms = divmod(ms, 60000)
+        s, ms = divmod(ms, 1000)
+        return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
+
+    def _save_profile(self, chosen, results):
+        profile_path = VideoAssembler(self.config).profile_path
+        os.makedirs(os.path.dirname(profile_path), exist_ok=True)
+
+        data = dict(chosen['profile'])
+        data['host'] = socket.gethostname()
+        data['cpu_count'] = os.cpu_count()
+        data['calibrated_at'] = datetime.now().isoformat(timespec='seconds')
+        data['results'] = results
+
+        with open(profile_path, 'w') as f:
+            json.dump(data, f, indent=2)
+        logger.info(f"✓ Encoding profile saved: {profile_path}")
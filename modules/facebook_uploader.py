@@ -1,13 +1,40 @@
+import os
 import requests
+from modules.upload_session import UploadSession, ProgressiveUpload, ResumableUpload
 from utils.logger import setup_logger
 
 logger = setup_logger()
 
 class FacebookUploader:
-    def __init__(self, access_token: str, page_id: str):
+    def __init__(self, access_token: str, page_id: str, upload_bandwidth_kbps: int = 0,
+                 graph_url: str = "https://graph.facebook.com/v18.0", chunk_size: int = 4 * 1024 * 1024,
+                 parallel_chunks: int = 1, resume_attempts: int = 5):
         self.access_token = access_token
         self.page_id = page_id
-        self.graph_url = "https://graph.facebook.com/v18.0"
+        self.upload_bandwidth_kbps = upload_bandwidth_kbps
+        self.graph_url = graph_url
+        self.chunk_size = chunk_size
+        self.parallel_chunks = parallel_chunks
+        self.resume_attempts = resume_attempts
+    
+    def _upload_timeout(self, video_path: str):
+        """Per-chunk timeout from chunk size and uplink budget (120s when unknown)"""
+        if not self.upload_bandwidth_kbps:
+            return 120
+        size = os.path.getsize(video_path)
+        expected = size * 8 / (self.upload_bandwidth_kbps * 1000)
+        logger.info(f"Uploading {size / 1024 / 1024:.1f}MB, expected ~{expected:.0f}s at {self.upload_bandwidth_kbps}kbps")
+        # Chunks in flight share the uplink; generous margin over the expected time
+        chunk_expected = min(size, self.chunk_size) * self.parallel_chunks * 8 / (self.upload_bandwidth_kbps * 1000)
+        return max(120, int(chunk_expected * 3))
+    
+    def _upload_file(self, video_path: str, title: str, description: str):
+        """Upload a finished file through a resumable chunked upload session"""
+        session = UploadSession(self.graph_url, self.page_id, self.access_token,
+                                timeout=self._upload_timeout(video_path))
+        upload = ResumableUpload(session, video_path, self.chunk_size, self.parallel_chunks,
+                                 attempts=self.resume_attempts)
+        return upload.upload(title, description)
     
     def upload_episode(self, video_path: str, episode: dict, caption_parts: dict, hashtags: list):
         """
@@ -33,22 +60,10 @@ class FacebookUploader:
             
             logger.info(f"Caption:\n{caption}")
             
-            # Direct video upload
-            upload_url = f"{self.graph_url}/{self.page_id}/videos"
-            
-            with open(video_path, 'rb') as video_file:
-                files = {'source': video_file}
-                data = {
-                    'access_token': self.access_token,
-                    'description': caption,
-                    'title': episode['title'],
-                }
-                
-                response = requests.post(upload_url, files=files, data=data, timeout=600)
-                response.raise_for_status()
-                result = response.json()
+            # Chunked upload session (resumes from the last acknowledged offset)
+            result = self._upload_file(video_path, episode['title'], caption)
             
-            video_id = result.get('id')
+            video_id = result.get('video_id')
             logger.info(f"Upload complete! Video ID: {video_id}")
             return {'success': True, 'video_id': video_id}
             
@@ -68,6 +83,46 @@ class FacebookUploader:
             logger.error(f"Upload error: {e}")
             raise
     
+    def start_progressive_upload(self):
+        """
+        Open a chunked upload session that is fed while the video encodes
+        
+        Pass the returned object's feed() as VideoAssembler's fragment_sink,
+        then call finish_progressive_upload() once the render is done.
+        """
+        session = UploadSession(self.graph_url, self.page_id, self.access_token)
+        progressive = ProgressiveUpload(session, self.chunk_size)
+        progressive.open()
+        return progressive
+    
+    def finish_progressive_upload(self, progressive, video_path: str, episode: dict, caption_parts: dict,
+                                  hashtags: list):
+        """
+        Finish a progressive upload, falling back to a regular upload of the
+        complete file if streaming failed part-way
+        """
+        ep_num = episode['episode_number']
+        total = episode['total_episodes']
+        
+        if progressive.error:
+            logger.warning(f"Progressive upload failed ({progressive.error}), uploading the finished file instead")
+            progressive.abort()
+            return self.upload_episode(video_path, episode, caption_parts, hashtags)
+        
+        logger.info(f"Finishing progressive upload of Episode {ep_num}/{total}: {episode['title']}")
+        all_hashtags = self._generate_trending_hashtags(hashtags)
+        caption = self._build_episode_caption(caption_parts, all_hashtags)
+        logger.info(f"Caption:\n{caption}")
+        
+        try:
+            result = progressive.close(episode['title'], caption)
+        except Exception as e:
+            logger.warning(f"Progressive upload failed at finish ({e}), uploading the finished file instead")
+            return self.upload_episode(video_path, episode, caption_parts, hashtags)
+        
+        logger.info(f"Upload complete! Video ID: {result['video_id']}")
+        return result
+    
     def _build_episode_caption(self, caption_parts: dict, hashtags: list):
         """Build caption for episode"""
         parts = []
@@ -103,22 +158,10 @@ class FacebookUploader:
             
             logger.info(f"Caption:\n{caption}")
             
-            # Direct video upload
-            upload_url = f"{self.graph_url}/{self.page_id}/videos"
-            
-            with open(video_path, 'rb') as video_file:
-                files = {'source': video_file}
-                data = {
-                    'access_token': self.access_token,
-                    'description': caption,
-                    'title': title,
-                }
-                
-                response = requests.post(upload_url, files=files, data=data, timeout=600)
-                response.raise_for_status()
-                result = response.json()
+            # Chunked upload session (resumes from the last acknowledged offset)
+            result = self._upload_file(video_path, title, caption)
             
-            video_id = result.get('id')
+            video_id = result.get('video_id')
             logger.info(f"Upload complete! Video ID: {video_id}")
             return {'success': True, 'video_id': video_id}
             
@@ -0,0 +1,95 @@
+import bisect
+import json
+import os
+import random
+import subprocess
+import threading
+from utils.logger import setup_logger
+
+logger = setup_logger()
+
+
+class KeyframeIndex:
+    """
+    Per-video keyframe timestamps, for cheap input seeking
+
+    A video given with its content key (the asset cache sha256) is indexed
+    under index_dir as <key>.keyframes.json, so the index outlives the
+    per-episode link to the clip; other videos (proxies) get a sidecar
+    next to the file.
+    """
+
+    def __init__(self, index_dir: str = None):
+        self.index_dir = index_dir
+
+    def get(self, video_path: str, key: str = None) -> list:
+        """
+        Get sorted keyframe times (seconds) for a video, building the index once
+
+        The index is rebuilt only when the video's size or mtime changes.
+        """
+        index_path = self.index_path(video_path, key)
+        stat = os.stat(video_path)
+
+        if os.path.exists(index_path):
+            try:
+                with open(index_path, 'r') as f:
+                    data = json.load(f)
+                if data['size'] == stat.st_size and data['mtime_ns'] == stat.st_mtime_ns:
+                    return data['keyframes']
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable keyframe index {index_path}: {e}")
+
+        keyframes = self._scan(video_path)
+        # Atomic: links to the same content share one index
+        tmp_path = f"{index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'keyframes': keyframes}, f)
+        os.replace(tmp_path, index_path)
+
+        spacing = (keyframes[-1] / (len(keyframes) - 1)) if len(keyframes) > 1 else 0
+        logger.info(f"✓ Indexed {len(keyframes)} keyframes in {video_path} (~{spacing:.2f}s apart)")
+        return keyframes
+
+    def nearest_keyframe(self, video_path: str, offset: float, key: str = None) -> float:
+        """Latest keyframe at or before offset"""
+        keyframes = self.get(video_path, key)
+        i = bisect.bisect_right(keyframes, offset) - 1
+        return keyframes[max(i, 0)] if keyframes else 0.0
+
+    def pick_start_offset(self, video_path: str, video_duration: float, needed: float,
+                          key: str = None) -> float:
+        """
+        Pick a random keyframe to start the background from
+
+        Prefers offsets that leave `needed` seconds before the clip loops;
+        clips shorter than that can start anywhere.
+        """
+        keyframes = self.get(video_path, key)
+        latest = video_duration - needed
+        if latest <= 0:
+            latest = video_duration
+        candidates = [t for t in keyframes if t < latest] or [0.0]
+        return random.choice(candidates)
+
+    def index_path(self, video_path: str, key: str = None) -> str:
+        if key and self.index_dir:
+            return os.path.join(self.index_dir, f"{key}.keyframes.json")
+        return video_path + '.keyframes.json'
+
+    def _scan(self, video_path: str) -> list:
+        # Packet flags only: demux, no decode
+        cmd = [
+            'ffprobe', '-v', 'error',
+            '-select_streams', 'v:0',
+            '-show_entries', 'packet=pts_time,flags',
+            '-of', 'csv=p=0',
+            video_path
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        keyframes = []
+        for line in result.stdout.splitlines():
+            pts_time, _, flags = line.partition(',')
+            if 'K' in flags and pts_time not in ('', 'N/A'):
+                keyframes.append(float(pts_time))
+        return sorted(keyframes) or [0.0]
@@ -0,0 +1,233 @@
+import json
+import math
+import os
+import numpy as np
+from utils import pcm
+from utils.artifact import Artifact
+from utils.logger import setup_logger
+
+logger = setup_logger()
+
+
+class LoudnessAnalyzer:
+    """
+    ITU-R BS.1770 loudness profiles, stored next to each asset
+
+    A profile holds integrated loudness (LUFS, gated), true peak (dBTP, 4x
+    oversampled) and the short-term loudness envelope (3s windows, 1s hop).
+    It is computed once per asset and rebuilt only when the asset's size or
+    mtime changes, so the mix can use fixed gains instead of a two-pass
+    loudnorm on every render.
+    """
+
+    # Measured as it will be mixed (mono narration is upmixed); the
+    # K-weighting is derived for whatever the rate is
+    SAMPLE_RATE = pcm.SAMPLE_RATE
+    CHANNELS = pcm.CHANNELS
+    BLOCK_CHUNK = 1 << 16  # Samples per FFT chunk
+    FIR_TAPS = 8192  # Truncated K-weighting impulse response (~170ms)
+    OVERSAMPLE = 4
+    PEAK_MARGIN = 64  # Samples discarded at each chunk edge when oversampling
+
+    def __init__(self, config):
+        self.config = config
+        self._kernel_fft = None
+
+    def get(self, path: str) -> dict:
+        """
+        Loudness profile for a media file, computed on first use
+
+        Artifacts keep their profile in meta rather than in a sidecar file.
+        """
+        if isinstance(path, Artifact):
+            if 'loudness' not in path.meta:
+                path.meta['loudness'] = self._log(self.analyze(pcm.decode_pcm(path)), path)
+            return path.meta['loudness']
+
+        profile_path = self.profile_path(path)
+        stat = os.stat(path)
+
+        if os.path.exists(profile_path):
+            try:
+                with open(profile_path, 'r') as f:
+                    data = json.load(f)
+                if data['size'] == stat.st_size and data['mtime_ns'] == stat.st_mtime_ns:
+                    return data
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable loudness profile {profile_path}: {e}")
+
+        profile = self.analyze(pcm.decode_pcm(path))
+        profile.update({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+        tmp_path = profile_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(profile, f)
+        os.replace(tmp_path, profile_path)
+        return self._log(profile, path)
+
+    def _log(self, profile, path):
+        logger.info(f"✓ Loudness {profile['integrated_lufs']:.1f} LUFS, "
+                    f"true peak {profile['true_peak_dbtp']:.1f} dBTP: {path}")
+        return profile
+
+    def profile_path(self, path: str) -> str:
+        return path + '.loudness.json'
+
+    def mix_gains(self, voice_path: str, music_path: str = None):
+        """
+        Fixed linear gains that put the narration at VOICE_TARGET_LUFS and the
+        music MUSIC_BELOW_VOICE_LU under it
+
+        Falls back to VOICE_VOLUME_BOOST / MUSIC_VOLUME for anything that
+        cannot be measured (e.g. silence).
+
+        Returns:
+            tuple: (voice_gain, music_gain)
+        """
+        voice_gain = self.config.VOICE_VOLUME_BOOST
+        music_gain = self.config.MUSIC_VOLUME
+        limit = self.config.MAX_LOUDNESS_GAIN_DB
+
+        voice = self.get(voice_path)
+        if math.isfinite(voice['integrated_lufs']):
+            gain_db = self.config.VOICE_TARGET_LUFS - voice['integrated_lufs']
+            # Do not push narration peaks over the ceiling
+            gain_db = min(gain_db, self.config.TRUE_PEAK_CEILING_DBTP - voice['true_peak_dbtp'])
+            voice_gain = self._db_to_gain(max(-limit, min(limit, gain_db)))
+
+        if music_path:
+            music = self.get(music_path)
+            if math.isfinite(music['integrated_lufs']):
+                target = self.config.VOICE_TARGET_LUFS - self.config.MUSIC_BELOW_VOICE_LU
+                gain_db = target - music['integrated_lufs']
+                music_gain = self._db_to_gain(max(-limit, min(limit, gain_db)))
+
+        logger.info(f"Mix gains: voice {20 * math.log10(voice_gain):+.1f}dB, "
+                    f"music {20 * math.log10(music_gain):+.1f}dB")
+        return voice_gain, music_gain
+
+    def analyze(self, samples: np.ndarray) -> dict:
+        """Profile float32 PCM, shape (samples, CHANNELS), at SAMPLE_RATE"""
+        power = self._weighted_power(samples)  # Summed over channels (G = 1 for L/R)
+        cumulative = np.concatenate([[0.0], np.cumsum(power, dtype=np.float64)])
+
+        # Gated integrated loudness: 400ms blocks, 75% overlap
+        block, hop = int(0.4 * self.SAMPLE_RATE), int(0.1 * self.SAMPLE_RATE)
+        block_power = self._window_means(cumulative, block, hop)
+        block_loudness = self._loudness(block_power)
+        gated = block_power[block_loudness > -70.0]
+        if len(gated):
+            relative_gate = self._loudness(gated.mean()) - 10.0
+            gated = gated[self._loudness(gated) > relative_gate]
+        integrated = float(self._loudness(gated.mean())) if len(gated) else -math.inf
+
+        # Short-term loudness: 3s windows, 1s hop
+        short_term = self._loudness(self._window_means(cumulative, 3 * self.SAMPLE_RATE, self.SAMPLE_RATE))
+
+        return {
+            'integrated_lufs': round(integrated, 2) if math.isfinite(integrated) else -math.inf,
+            'true_peak_dbtp': round(float(self._true_peak_db(samples)), 2),
+            'short_term_lufs': [round(float(v), 1) if math.isfinite(v) else None for v in short_term],
+            'short_term_hop_seconds': 1.0,
+            'duration': len(samples) / self.SAMPLE_RATE,
+        }
+
+    def _weighted_power(self, samples):
+        """K-weighted instantaneous power, summed over channels (FFT overlap-add)"""
+        n = len(samples)
+        kernel_fft = self._k_weighting_fft()
+        n_fft = 2 * (len(kernel_fft) - 1)
+        chunk = n_fft - self.FIR_TAPS + 1
+        n_chunks = max(1, -(-n // chunk))
+
+        padded = np.zeros((n_chunks * chunk, self.CHANNELS), dtype=np.float32)
+        padded[:n] = samples
+        frames = padded.reshape(n_chunks, chunk, self.CHANNELS)
+
+        filtered = np.zeros((n_chunks * chunk + n_fft, self.CHANNELS), dtype=np.float32)
+        # Batches bound memory while keeping each FFT call vectorised
+        for first in range(0, n_chunks, 16):
+            batch = frames[first:first + 16]
+            spectra = np.fft.rfft(batch, n=n_fft, axis=1) * kernel_fft[None, :, None]
+            out = np.fft.irfft(spectra, n=n_fft, axis=1).astype(np.float32)
+            for i, block in enumerate(out):
+                start = (first + i) * chunk
+                filtered[start:start + n_fft] += block
+
+        return np.sum(filtered[:n].astype(np.float64) ** 2, axis=1)
+
+    def _k_weighting_fft(self):
+        """Frequency response of the truncated K-weighting FIR, for n_fft = 2 * BLOCK_CHUNK"""
+        if self._kernel_fft is None:
+            n_fft = 2 * self.BLOCK_CHUNK
+            z = np.exp(-1j * 2 * np.pi * np.arange(n_fft // 2 + 1) / n_fft)
+            response = np.ones_like(z)
+            for b, a in self._k_weighting_biquads(self.SAMPLE_RATE):
+                response *= (b[0] + b[1] * z + b[2] * z ** 2) / (a[0] + a[1] * z + a[2] * z ** 2)
+            impulse = np.fft.irfft(response, n=n_fft)[:self.FIR_TAPS]
+            self._kernel_fft = np.fft.rfft(impulse, n=n_fft)
+        return self._kernel_fft
+
+    @staticmethod
+    def _k_weighting_biquads(fs):
+        """
+        BS.1770 pre-filter (high shelf) and RLB high-pass for any sample rate
+
+        Bilinear designs fitted to the 48kHz coefficients in the standard
+        (same constants as libebur128).
+        """
+        # High shelf: +4dB above ~1.7kHz
+        fc, gain_db, q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+        k = np.tan(np.pi * fc / fs)
+        vh = 10 ** (gain_db / 20)
+        vb = vh ** 0.4996667741545416
+        shelf = (
+            [vh + vb * k / q + k * k, 2 * (k * k - vh), vh - vb * k / q + k * k],
+            [1 + k / q + k * k, 2 * (k * k - 1), 1 - k / q + k * k],
+        )
+
+        # High-pass at ~38Hz
+        fc, q = 38.13547087602444, 0.5003270373238773
+        k = np.tan(np.pi * fc / fs)
+        a0 = 1 + k / q + k * k
+        # The standard keeps the numerator at [1, -2, 1] after normalising by a0
+        highpass = (
+            [a0, -2 * a0, a0],
+            [a0, 2 * (k * k - 1), 1 - k / q + k * k],
+        )
+        return [shelf, highpass]
+
+    def _true_peak_db(self, samples):
+        """Peak of the 4x oversampled signal (FFT interpolation per chunk)"""
+        if len(samples) == 0:
+            return -math.inf
+        margin, factor = self.PEAK_MARGIN, self.OVERSAMPLE
+        hop = self.BLOCK_CHUNK - 2 * margin
+        n_chunks = -(-len(samples) // hop)
+
+        padded = np.zeros((n_chunks * hop + 2 * margin, self.CHANNELS), dtype=np.float32)
+        padded[margin:margin + len(samples)] = samples
+        windows = np.lib.stride_tricks.sliding_window_view(padded, self.BLOCK_CHUNK, axis=0)[::hop]
+
+        peak = float(np.max(np.abs(samples)))
+        for first in range(0, len(windows), 16):
+            spectra = np.fft.rfft(windows[first:first + 16], axis=-1)
+            upsampled = np.fft.irfft(spectra, n=self.BLOCK_CHUNK * factor, axis=-1) * factor
+            core = upsampled[..., margin * factor:(self.BLOCK_CHUNK - margin) * factor]
+            peak = max(peak, float(np.max(np.abs(core))))
+        return 20 * math.log10(peak) if peak > 0 else -math.inf
+
+    @staticmethod
+    def _window_means(cumulative, window, hop):
+        n = len(cumulative) - 1
+        if n < window:
+            return np.array([cumulative[-1] / max(n, 1)]) if n else np.zeros(0)
+        starts = np.arange(0, n - window + 1, hop)
+        return (cumulative[starts + window] - cumulative[starts]) / window
+
+    @staticmethod
+    def _loudness(mean_power):
+        return -0.691 + 10 * np.log10(np.maximum(mean_power, 1e-12))
+
+    @staticmethod
+    def _db_to_gain(db):
+        return 10 ** (db / 20)
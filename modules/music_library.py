@@ -0,0 +1,185 @@
+import json
+import os
+import random
+import subprocess
+import threading
+import time
+from utils.http_client import http_client
+from utils.logger import setup_logger
+from utils.media_probe import media_probe
+
+logger = setup_logger()
+
+
+class MusicLibrary:
+    """
+    Local library of background music tracks
+
+    Tracks are fetched once through the asset cache, stored as AAC under
+    MUSIC_LIBRARY_DIR, validated as having audio, pre-decoded to PCM (with
+    the NumPy mixer) and given a loudness profile. The Pixabay search
+    results are indexed with a TTL, so picking a track for an episode is a
+    local lookup and the network is only touched when the library is
+    refreshed.
+    """
+
+    PIXABAY_URL = "https://pixabay.com/api/videos/"
+
+    def __init__(self, config, asset_cache, audio_mixer=None, loudness=None):
+        self.config = config
+        self.asset_cache = asset_cache
+        self.audio_mixer = audio_mixer
+        self.loudness = loudness
+        self.library_dir = config.MUSIC_LIBRARY_DIR
+        self.tracks_dir = os.path.join(self.library_dir, 'tracks')
+        self.index_path = os.path.join(self.library_dir, 'index.json')
+        self._lock = threading.Lock()
+        os.makedirs(self.tracks_dir, exist_ok=True)
+        self.index = self._load_index()
+
+    def pick(self) -> str:
+        """
+        Path of the track to use for an episode
+
+        The configured FALLBACK_MUSIC_URL track is preferred (as before);
+        otherwise a random stored Pixabay track is used. The library is
+        refreshed only when its index is stale or it has nothing to offer.
+        """
+        if self.is_stale() or not self._available():
+            self.refresh()
+
+        primary = self._track(self.config.FALLBACK_MUSIC_URL) if self.config.FALLBACK_MUSIC_URL else None
+        if primary:
+            logger.info(f"✓ Music from library (primary): {primary['path']}")
+            return primary['path']
+
+        tracks = [t for t in self._available() if t['source_url'] != self.config.FALLBACK_MUSIC_URL]
+        if not tracks:
+            raise ValueError("Music library is empty")
+        track = random.choice(tracks)
+        logger.info(f"✓ Music from library: {track['path']}")
+        return track['path']
+
+    def tracks(self) -> list:
+        """Every stored track"""
+        return self._available()
+
+    def is_stale(self) -> bool:
+        age = time.time() - self.index.get('refreshed_at', 0)
+        return age > self.config.MUSIC_INDEX_TTL_HOURS * 3600
+
+    def refresh(self):
+        """Re-check the primary track and top up Pixabay tracks if it is unusable"""
+        logger.info("Refreshing music library...")
+        if self.config.FALLBACK_MUSIC_URL:
+            try:
+                self.add_track(self.config.FALLBACK_MUSIC_URL)
+            except Exception as e:
+                logger.warning(f"Primary music track unusable: {e}")
+
+        # Pixabay is only a fallback, so only search when there is no primary
+        if not self._track(self.config.FALLBACK_MUSIC_URL) and self.config.PIXABAY_API_KEY:
+            try:
+                self._fill_from_pixabay()
+            except Exception as e:
+                logger.warning(f"Pixabay refresh failed: {e}")
+
+        with self._lock:
+            self.index['refreshed_at'] = time.time()
+            self._save_index()
+        logger.info(f"✓ Music library has {len(self._available())} tracks")
+
+    def add_track(self, url: str) -> dict:
+        """
+        Store the audio of url in the library (no-op if the content is unchanged)
+
+        Returns:
+            dict: Track entry (path, duration, source_url, sha256)
+        """
+        source_path = self.asset_cache.fetch(url)
+        sha256 = self.asset_cache.content_hash(url)
+        existing = self._track(url)
+        if existing and existing['sha256'] == sha256:
+            return existing
+
+        if not media_probe.has_audio_stream(source_path):
+            raise ValueError(f"No audio stream in {url}")
+
+        track_path = os.path.join(self.tracks_dir, f"{sha256[:16]}.m4a")
+        if not os.path.exists(track_path):
+            self._extract_audio(source_path, track_path)
+        duration = media_probe.get_duration(track_path)
+        if duration < 1.0:
+            os.remove(track_path)
+            raise ValueError(f"Track too short ({duration:.2f}s): {url}")
+
+        if self.audio_mixer:
+            self.audio_mixer.predecode(track_path)
+        if self.loudness:
+            self.loudness.get(track_path)
+
+        entry = {'source_url': url, 'sha256': sha256, 'path': track_path, 'duration': duration}
+        with self._lock:
+            self.index.setdefault('tracks', {})[url] = entry
+            self._save_index()
+        logger.info(f"✓ Added music track ({duration:.0f}s): {url}")
+        return entry
+
+    def _fill_from_pixabay(self):
+        params = {'key': self.config.PIXABAY_API_KEY, 'q': 'background music', 'per_page': 20}
+        response = http_client.get(self.PIXABAY_URL, 'api', params=params)
+        response.raise_for_status()
+        hits = [hit['videos']['medium']['url'] for hit in response.json().get('hits', [])]
+        if not hits:
+            raise ValueError("No music found on Pixabay")
+
+        with self._lock:
+            self.index['search_hits'] = hits
+
+        stored = [t for t in self._available() if t['source_url'] in hits]
+        candidates = [url for url in hits if not self._track(url)]
+        random.shuffle(candidates)
+        for url in candidates[:max(0, self.config.MUSIC_LIBRARY_TRACKS - len(stored))]:
+            try:
+                self.add_track(url)
+            except Exception as e:
+                logger.warning(f"Skipping Pixabay track {url}: {e}")
+
+    def _extract_audio(self, source_path, track_path):
+        tmp_path = track_path + '.tmp.m4a'
+        cmd = [
+            'ffmpeg', '-y', '-v', 'error',
+            '-i', source_path,
+            '-map', '0:a:0', '-vn',
+            '-c:a', 'aac', '-b:a', f"{self.config.AUDIO_BITRATE_KBPS}k", '-ar', '44100',
+            tmp_path
+        ]
+        subprocess.run(cmd, capture_output=True, check=True)
+        os.replace(tmp_path, track_path)
+
+    def _track(self, url):
+        if not url:
+            return None
+        with self._lock:
+            entry = self.index.get('tracks', {}).get(url)
+        return entry if entry and os.path.exists(entry['path']) else None
+
+    def _available(self):
+        with self._lock:
+            tracks = list(self.index.get('tracks', {}).values())
+        return [t for t in tracks if os.path.exists(t['path'])]
+
+    def _load_index(self):
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r') as f:
+                    return json.load(f)
+            except Exception as e:
+                logger.warning(f"Music library index unreadable, starting empty: {e}")
+        return {}
+
+    def _save_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(tmp_path, self.index_path)
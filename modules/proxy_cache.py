@@ -0,0 +1,95 @@
+import hashlib
+import os
+import subprocess
+from utils.ffmpeg_runner import FFmpegRunner
+from utils.logger import setup_logger
+from utils.media_probe import media_probe
+
+logger = setup_logger()
+
+
+class ProxyCache:
+    """Library of background clips pre-transcoded to the output resolution"""
+
+    def __init__(self, config):
+        self.proxy_dir = config.PROXY_DIR
+        # Proxies are made at the largest output so variants are never upscaled
+        resolutions = [tuple(config.OUTPUT_RESOLUTION)]
+        resolutions += [tuple(v['resolution']) for v in config.OUTPUT_VARIANTS]
+        self.width, self.height = max(resolutions, key=lambda r: r[0] * r[1])
+        self.fps = config.PROXY_FPS
+        self.gop = int(config.PROXY_FPS * config.PROXY_GOP_SECONDS)
+        self.ffmpeg = FFmpegRunner(
+            stall_timeout=config.FFMPEG_STALL_TIMEOUT,
+            max_retries=config.FFMPEG_MAX_RETRIES,
+            stderr_lines=config.FFMPEG_STDERR_LINES
+        )
+        os.makedirs(self.proxy_dir, exist_ok=True)
+
+    def get(self, key: str):
+        """
+        Look up the proxy for a background (key: content hash or URL)
+
+        Returns:
+            str: Path to proxy, or None if it has not been built yet
+        """
+        proxy_path = self._proxy_path(key)
+        if os.path.exists(proxy_path):
+            logger.info(f"✓ Using cached proxy: {proxy_path}")
+            return proxy_path
+        return None
+
+    def build(self, key: str, source_path: str) -> str:
+        """
+        Transcode a full-resolution background into a proxy
+
+        The proxy is scaled and cropped to the output resolution, resampled
+        to a fixed frame rate, stripped of audio and encoded with a short GOP
+        so the assembler can use it without any scaling and seek cheaply.
+
+        Args:
+            key: Cache key (content hash or URL of the background)
+            source_path: Downloaded full-resolution clip
+
+        Returns:
+            str: Path to proxy
+        """
+        proxy_path = self._proxy_path(key)
+        tmp_path = proxy_path + '.tmp.mp4'
+        w, h = self.width, self.height
+
+        logger.info(f"Building {w}x{h}@{self.fps} proxy for {source_path}")
+
+        cmd = [
+            'ffmpeg', '-y',
+            '-i', source_path,
+            '-an',
+            '-vf', f"scale={w}:{h}:force_original_aspect_ratio=increase,crop={w}:{h},fps={self.fps}",
+            '-c:v', 'libx264',
+            '-preset', 'veryfast',
+            '-crf', '18',
+            '-g', str(self.gop),
+            '-keyint_min', str(self.gop),
+            '-sc_threshold', '0',
+            '-pix_fmt', 'yuv420p',
+            '-movflags', '+faststart',
+            tmp_path
+        ]
+
+        try:
+            self.ffmpeg.run(cmd, duration=media_probe.get_duration(source_path), label="Proxy")
+            os.replace(tmp_path, proxy_path)
+        except subprocess.CalledProcessError as e:
+            logger.error(f"Proxy transcode failed: {e.stderr}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        logger.info(f"✓ Proxy ready: {proxy_path} ({media_probe.get_duration(proxy_path):.2f}s)")
+        return proxy_path
+
+    def _proxy_path(self, key: str) -> str:
+        # Resolution and fps are part of the key so a settings change rebuilds
+        key = f"{key}|{self.width}x{self.height}|{self.fps}|{self.gop}"
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.proxy_dir, f"proxy_{digest}.mp4")
@@ -1,8 +1,10 @@
-import subprocess
-import json
+import io
+import os
 import pysrt
 from groq import Groq
+from utils.artifact import Artifact
 from utils.logger import setup_logger
+from utils.media_probe import media_probe
 
 logger = setup_logger()
 
@@ -11,18 +13,28 @@ class SubtitleGenerator:
         self.client = Groq(api_key=api_key)
     
     def generate_subtitles(self, audio_path: str, output_path: str, text: str = None):
+        """
+        Build word-synced subtitles from the narration
+        
+        audio_path and output_path may be Artifacts: the audio is uploaded
+        straight from memory and the SRT is written into the buffer.
+        """
         logger.info("Generating subtitles using Groq Whisper with word-level timestamps")
         try:
             # Use Groq Whisper to get exact word timestamps
-            with open(audio_path, 'rb') as audio_file:
-                logger.info("Transcribing audio with Groq Whisper...")
-                
-                transcription = self.client.audio.transcriptions.create(
-                    model="whisper-large-v3",
-                    file=audio_file,
-                    response_format="verbose_json",
-                    timestamp_granularities=["word"]
-                )
+            logger.info("Transcribing audio with Groq Whisper...")
+            if isinstance(audio_path, Artifact):
+                audio_file = (os.path.basename(audio_path.path), audio_path.getvalue())
+            else:
+                with open(audio_path, 'rb') as f:
+                    audio_file = (os.path.basename(audio_path), f.read())
+            
+            transcription = self.client.audio.transcriptions.create(
+                model="whisper-large-v3",
+                file=audio_file,
+                response_format="verbose_json",
+                timestamp_granularities=["word"]
+            )
             
             # Extract word-level timestamps (they come as dictionaries)
             words_data = transcription.words
@@ -61,7 +73,14 @@ class SubtitleGenerator:
                 subs.append(sub)
             
             # Save SRT file
-            subs.save(output_path, encoding='utf-8')
+            if isinstance(output_path, Artifact):
+                srt = io.StringIO()
+                subs.write_into(srt)
+                output_path.reset()
+                output_path.write(srt.getvalue().encode('utf-8'))
+                output_path.close()
+            else:
+                subs.save(output_path, encoding='utf-8')
             
             # Get audio duration for verification
             audio_duration = self._get_audio_duration(audio_path)
@@ -80,15 +99,5 @@ class SubtitleGenerator:
             raise
     
     def _get_audio_duration(self, audio_path: str):
-        """Get exact audio duration using ffprobe"""
-        cmd = [
-            'ffprobe', 
-            '-v', 'error', 
-            '-show_entries', 'format=duration', 
-            '-of', 'json', 
-            audio_path
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        data = json.loads(result.stdout)
-        duration = float(data['format']['duration'])
-        return duration
+        """Get exact audio duration (shared cached probe)"""
+        return media_probe.get_duration(audio_path)
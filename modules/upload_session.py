@@ -0,0 +1,360 @@
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from utils.http_client import http_client
+from utils.logger import setup_logger, with_log_context
+
+logger = setup_logger()
+
+
+class UploadSession:
+    """
+    Graph API chunked video upload session (upload_phase=start/transfer/finish)
+
+    start() and transfer() return the server's (start_offset, end_offset):
+    the next transfer must carry exactly the bytes [start_offset, end_offset).
+    """
+
+    def __init__(self, graph_url: str, page_id: str, access_token: str, timeout: int = 120):
+        self.upload_url = f"{graph_url}/{page_id}/videos"
+        self.access_token = access_token
+        self.timeout = timeout
+        self.video_id = None
+        self.session_id = None
+
+    def resume(self, session_id: str, video_id: str):
+        """Continue a session opened earlier (see ResumableUpload)"""
+        self.session_id = session_id
+        self.video_id = video_id
+
+    def start(self, file_size: int = None) -> tuple:
+        """
+        Open the session
+
+        Args:
+            file_size: Total bytes, or None when the file is still being
+                written (progressive mode; the size is sent at finish)
+
+        Returns:
+            tuple: (start_offset, end_offset) of the first chunk to send
+        """
+        data = {'access_token': self.access_token, 'upload_phase': 'start'}
+        if file_size is not None:
+            data['file_size'] = file_size
+        result = self._post(data)
+
+        self.video_id = result.get('video_id')
+        self.session_id = result['upload_session_id']
+        logger.info(f"Upload session started: {self.session_id} (video {self.video_id})")
+        return self._offsets(result)
+
+    def transfer(self, offset: int, chunk: bytes) -> tuple:
+        """
+        Send one chunk starting at offset
+
+        Returns:
+            tuple: (start_offset, end_offset) of the next chunk to send;
+                start_offset may be < offset + len(chunk) if the server only
+                accepted part of the chunk
+        """
+        data = {
+            'access_token': self.access_token,
+            'upload_phase': 'transfer',
+            'upload_session_id': self.session_id,
+            'start_offset': offset,
+        }
+        files = {'video_file_chunk': ('chunk', chunk, 'application/octet-stream')}
+        result = self._post(data, files=files)
+        return self._offsets(result)
+
+    def finish(self, title: str, description: str, file_size: int = None) -> dict:
+        data = {
+            'access_token': self.access_token,
+            'upload_phase': 'finish',
+            'upload_session_id': self.session_id,
+            'title': title,
+            'description': description,
+        }
+        if file_size is not None:
+            data['file_size'] = file_size
+        result = self._post(data)
+        if not result.get('success', False):
+            raise RuntimeError(f"Upload session finish failed: {result}")
+        logger.info(f"Upload session finished: video {self.video_id}")
+        return {'success': True, 'video_id': self.video_id}
+
+    def _offsets(self, result):
+        start = int(result.get('start_offset', 0))
+        end = result.get('end_offset')
+        return start, int(end) if end is not None else None
+
+    def _post(self, data, files=None):
+        response = http_client.post(self.upload_url, 'upload', data=data, files=files, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+
+class ProgressiveUpload:
+    """
+    Streams a file into an UploadSession while it is still being written
+
+    feed() is called with bytes as the encoder produces them; full chunks
+    are handed to a worker thread through a bounded queue, so a slow
+    uplink back-pressures the encoder instead of buffering the whole file.
+    """
+
+    def __init__(self, session: UploadSession, chunk_size: int, max_buffered_chunks: int = 4):
+        self.session = session
+        self.chunk_size = chunk_size
+        self._pending = bytearray()
+        self._queue = queue.Queue(maxsize=max_buffered_chunks)
+        self._worker = None
+        self.offset = 0
+        self._end = None  # end_offset the server asked for last
+        self.error = None
+
+    def open(self):
+        self.offset, self._end = self.session.start()
+        self._worker = threading.Thread(target=with_log_context(self._run), daemon=True)
+        self._worker.start()
+
+    def feed(self, data: bytes):
+        """Append encoder output (raises if the upload has already failed)"""
+        if self.error:
+            raise self.error
+        self._pending += data
+        while len(self._pending) >= self.chunk_size:
+            chunk = bytes(self._pending[:self.chunk_size])
+            del self._pending[:self.chunk_size]
+            self._put(chunk)
+
+    def close(self, title: str, description: str) -> dict:
+        """Flush the tail, wait for all chunks and finish the session"""
+        if self._pending:
+            self._put(bytes(self._pending))
+            self._pending = bytearray()
+        self._put(None)
+        self._worker.join()
+        if self.error:
+            raise self.error
+        return self.session.finish(title, description, file_size=self.offset)
+
+    def abort(self):
+        self.error = self.error or RuntimeError("Progressive upload aborted")
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def _put(self, chunk):
+        # Wake up periodically so a failed worker cannot block the encoder forever
+        while True:
+            if self.error and chunk is not None:
+                raise self.error
+            try:
+                self._queue.put(chunk, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def _run(self):
+        try:
+            while True:
+                chunk = self._queue.get()
+                if chunk is None or self.error:
+                    return
+                start = self.offset
+                sent = 0
+                # Resend the part the server did not accept; never more than it asked for
+                while sent < len(chunk):
+                    limit = len(chunk)
+                    if self._end is not None and self._end > start + sent:
+                        limit = min(limit, self._end - start)
+                    next_offset, self._end = self.session.transfer(start + sent, chunk[sent:limit])
+                    if next_offset <= start + sent:
+                        raise RuntimeError(f"Upload made no progress at offset {start + sent}")
+                    sent = next_offset - start
+                self.offset = start + len(chunk)
+                logger.debug(f"Uploaded {self.offset / 1024 / 1024:.1f}MB")
+        except Exception as e:
+            logger.error(f"Progressive upload failed at offset {self.offset}: {e}")
+            self.error = e
+            # Drain so producers blocked on put() can notice the error
+            while not self._queue.empty():
+                self._queue.get_nowait()
+
+
+class ResumableUpload:
+    """
+    Uploads a finished file through an UploadSession, chunk by chunk
+
+    Each chunk is the [start_offset, end_offset) range the server asked for
+    (chunk_size when it does not say) and is read from the file at its
+    offset (os.pread), so memory stays at one chunk whatever the file size. The last offset
+    the server acknowledged is kept in a sidecar (<path>.upload.json): a
+    failed attempt is resumed from there in the same session, and so is a
+    later upload of the same unchanged file.
+
+    With parallel > 1 several chunk_size chunks are in flight at once. The
+    Graph API expects chunks in order, so this is only for endpoints that
+    accept out-of-order chunks (such as tools/stub_graph_server.py).
+    """
+
+    def __init__(self, session: UploadSession, path: str, chunk_size: int, parallel: int = 1,
+                 attempts: int = 5):
+        self.session = session
+        self.path = path
+        self.chunk_size = chunk_size
+        self.parallel = max(1, parallel)
+        self.attempts = attempts
+        self.state_path = path + '.upload.json'
+        self.confirmed = 0  # Last offset the server acknowledged
+
+    def upload(self, title: str, description: str) -> dict:
+        """
+        Upload the file, resuming after failures
+
+        The attempt budget is per stretch without progress: it starts over
+        whenever the server has acknowledged more of the file, so scattered
+        transient failures over a long upload do not add up.
+
+        Returns:
+            dict: {'success': True, 'video_id': ...}
+        """
+        attempt = 1
+        while True:
+            confirmed = self.confirmed
+            try:
+                return self._upload_once(title, description)
+            except (requests.exceptions.RequestException, RuntimeError) as e:
+                if self.confirmed > confirmed:
+                    attempt = 1
+                elif attempt == self.attempts:
+                    raise
+                else:
+                    attempt += 1
+                delay = min(60, 2 ** (attempt - 1))
+                logger.warning(f"Upload failed at {self.confirmed / 1024 / 1024:.1f}MB ({e}), "
+                               f"resuming in {delay}s (attempt {attempt}/{self.attempts})...")
+                time.sleep(delay)
+
+    def _upload_once(self, title, description):
+        stat = os.stat(self.path)
+        state = self._load_state(stat)
+        if state:
+            self.session.resume(state['session_id'], state['video_id'])
+            offset, end = state['offset'], state.get('end_offset')
+            logger.info(f"Resuming upload session {state['session_id']} at "
+                        f"{offset / 1024 / 1024:.1f}/{stat.st_size / 1024 / 1024:.1f}MB")
+        else:
+            offset, end = self.session.start(stat.st_size)
+            self._save_state(stat, offset, end)
+
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+            try:
+                if self.parallel > 1:
+                    self._transfer_parallel(fd, stat, offset)
+                else:
+                    self._transfer_sequential(fd, stat, offset, end)
+            finally:
+                os.close(fd)
+            result = self.session.finish(title, description, file_size=stat.st_size)
+        except requests.exceptions.HTTPError as e:
+            status = e.response.status_code if e.response is not None else None
+            if state and status and 400 <= status < 500 and status != 429:
+                # Expired or unknown session: the next attempt starts a new one
+                logger.warning(f"Upload session {state['session_id']} rejected ({status}), starting over")
+                self._clear_state()
+            raise
+
+        self._clear_state()
+        return result
+
+    def _transfer_sequential(self, fd, stat, offset, end):
+        size = stat.st_size
+        while offset < size:
+            if end is None or not offset < end <= size:
+                end = min(size, offset + self.chunk_size)
+            chunk = os.pread(fd, end - offset, offset)
+            # The server says where to continue (it may accept only part of a chunk)
+            next_offset, end = self.session.transfer(offset, chunk)
+            if next_offset <= offset:
+                raise RuntimeError(f"Upload made no progress at offset {offset}")
+            offset = next_offset
+            self._save_state(stat, offset, end)
+            logger.debug(f"Uploaded {offset / 1024 / 1024:.1f}/{size / 1024 / 1024:.1f}MB")
+
+    def _transfer_parallel(self, fd, stat, offset):
+        size = stat.st_size
+        acked = set()
+
+        def send(chunk_offset):
+            chunk = os.pread(fd, min(self.chunk_size, size - chunk_offset), chunk_offset)
+            end = chunk_offset + len(chunk)
+            sent = chunk_offset
+            while True:
+                next_offset, _ = self.session.transfer(sent, chunk[sent - chunk_offset:])
+                # Inside the chunk: only part of it was accepted, resend the rest.
+                # At or before `sent` the chunk is ahead of the server's contiguous
+                # data (out of order), which such endpoints hold on to.
+                if not sent < next_offset < end:
+                    return chunk_offset
+                sent = next_offset
+
+        with ThreadPoolExecutor(max_workers=self.parallel) as pool:
+            futures = [pool.submit(with_log_context(send), o) for o in range(offset, size, self.chunk_size)]
+            try:
+                for future in as_completed(futures):
+                    acked.add(future.result())
+                    # Only the contiguous acknowledged prefix is safe to resume from
+                    while offset in acked:
+                        acked.discard(offset)
+                        offset = min(size, offset + self.chunk_size)
+                    self._save_state(stat, offset)
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+        logger.debug(f"Uploaded {size / 1024 / 1024:.1f}MB in chunks of {self.chunk_size // 1024}KB "
+                     f"({self.parallel} at a time)")
+
+    def _load_state(self, stat):
+        if not os.path.exists(self.state_path):
+            return None
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable upload state {self.state_path}: {e}")
+            return None
+        # A different file or destination cannot continue that session
+        if (state.get('upload_url') != self.session.upload_url or state.get('size') != stat.st_size or
+                state.get('mtime_ns') != stat.st_mtime_ns):
+            self._clear_state()
+            return None
+        return state
+
+    def _save_state(self, stat, offset, end=None):
+        self.confirmed = offset
+        state = {
+            'upload_url': self.session.upload_url,
+            'session_id': self.session.session_id,
+            'video_id': self.session.video_id,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'offset': offset,
+            'end_offset': end,
+        }
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _clear_state(self):
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
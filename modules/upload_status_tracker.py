@@ -0,0 +1,234 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from utils.http_client import http_client
+from utils.logger import setup_logger
+
+logger = setup_logger()
+
+
+class UploadStatusTracker:
+    """
+    Follows uploaded videos until Facebook has processed and published them
+
+    A background thread polls every tracked video's status with Graph batch
+    requests (one HTTP request for up to BATCH_LIMIT videos). Each video has
+    its own poll interval: it starts at STATUS_POLL_INITIAL_SECONDS, grows
+    while nothing changes and resets when the video reaches a new phase. A
+    failed batch request backs off the whole tracker.
+
+    Time-to-published (and failures) are appended to PUBLISH_LOG_FILE. A
+    video that fails processing, or is still not published after
+    STATUS_GIVE_UP_MINUTES, is passed to on_failure(video_id, label, reason)
+    so it can be uploaded again.
+    """
+
+    BATCH_LIMIT = 50  # Graph API maximum per batch request
+    BACKOFF_FACTOR = 1.5
+    # Graph error codes for throttling: retry later rather than fail the video
+    THROTTLE_CODES = {4, 17, 32, 613}
+
+    def __init__(self, config, on_failure=None):
+        self.graph_url = config.FACEBOOK_GRAPH_URL
+        self.access_token = config.FACEBOOK_ACCESS_TOKEN
+        self.initial_interval = config.STATUS_POLL_INITIAL_SECONDS
+        self.max_interval = config.STATUS_POLL_MAX_SECONDS
+        self.give_up_seconds = config.STATUS_GIVE_UP_MINUTES * 60
+        self.log_path = config.PUBLISH_LOG_FILE
+        self.on_failure = on_failure
+        self._videos = {}  # video_id -> tracking entry
+        self._backoff = 0.0  # Extra delay after failed batch requests
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def track(self, video_id: str, label: str):
+        """Start following an uploaded video (label names it in logs and the publish log)"""
+        now = time.time()
+        with self._cond:
+            self._videos[video_id] = {
+                'video_id': video_id,
+                'label': label,
+                'uploaded_at': now,
+                'next_poll': now + self.initial_interval,
+                'interval': self.initial_interval,
+                'phase': None,
+                # Log context of the episode, for the records about this video
+                'context': contextvars.copy_context(),
+            }
+            self._cond.notify_all()
+        self.start()
+        logger.info(f"Tracking processing of video {video_id} ({label})")
+
+    def start(self):
+        with self._cond:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name='upload-status', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=10)
+
+    def pending(self, prefix: str = '') -> list:
+        """Labels of videos still being processed (optionally only those starting with prefix)"""
+        with self._cond:
+            return [v['label'] for v in self._videos.values() if v['label'].startswith(prefix)]
+
+    def wait(self, timeout: float, prefix: str = '') -> bool:
+        """
+        Block until the matching videos are published or failed
+
+        Returns:
+            bool: True if none are pending any more
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while any(v['label'].startswith(prefix) for v in self._videos.values()):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(timeout=remaining)
+        return True
+
+    def poll(self):
+        """Poll the videos that are due, one batch request per BATCH_LIMIT videos"""
+        now = time.time()
+        with self._cond:
+            # Videos within half an interval of their turn join the request that is going out anyway
+            due = sorted((v for v in self._videos.values() if v['next_poll'] - v['interval'] / 2 <= now),
+                         key=lambda v: v['next_poll'])
+        for i in range(0, len(due), self.BATCH_LIMIT):
+            batch = due[i:i + self.BATCH_LIMIT]
+            responses = self._request_batch([v['video_id'] for v in batch])
+            for entry, response in zip(batch, responses):
+                entry['context'].copy().run(self._apply, entry, response)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    due = min((v['next_poll'] for v in self._videos.values()), default=None)
+                    delay = 60.0 if due is None else due - time.time()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(timeout=delay)
+                if self._stopped:
+                    return
+            try:
+                self.poll()
+                self._backoff = 0.0
+            except Exception as e:
+                self._backoff = min(self.max_interval, max(self.initial_interval, self._backoff * 2))
+                logger.warning(f"Status batch request failed ({e}), backing off {self._backoff:.0f}s")
+                with self._cond:
+                    for entry in self._videos.values():
+                        entry['next_poll'] = max(entry['next_poll'], time.time() + self._backoff)
+
+    def _request_batch(self, video_ids):
+        batch = [{'method': 'GET', 'relative_url': f"{video_id}?fields=status"} for video_id in video_ids]
+        response = http_client.post(self.graph_url, 'api', data={
+            'access_token': self.access_token,
+            'include_headers': 'false',
+            'batch': json.dumps(batch),
+        })
+        response.raise_for_status()
+        responses = response.json()
+        if not isinstance(responses, list) or len(responses) != len(video_ids):
+            raise RuntimeError(f"Unexpected batch response: {str(responses)[:200]}")
+        return responses
+
+    def _apply(self, entry, response):
+        state, phase, reason = self._classify(response)
+        now = time.time()
+        if state == 'pending' and now - entry['uploaded_at'] > self.give_up_seconds:
+            state, reason = 'failed', f"not published after {self.give_up_seconds / 60:.0f} minutes ({phase})"
+
+        with self._cond:
+            if state == 'pending':
+                if phase != entry['phase']:
+                    entry['phase'] = phase
+                    entry['interval'] = self.initial_interval
+                else:
+                    entry['interval'] = min(self.max_interval, entry['interval'] * self.BACKOFF_FACTOR)
+                entry['next_poll'] = now + entry['interval']
+                return
+
+        elapsed = now - entry['uploaded_at']
+        self._record(entry, state, elapsed, reason)
+        if state == 'published':
+            logger.info(f"✓ Video {entry['video_id']} ({entry['label']}) published {elapsed / 60:.1f} min after upload")
+        else:
+            logger.error(f"❌ Video {entry['video_id']} ({entry['label']}) failed: {reason}")
+            if self.on_failure:
+                try:
+                    self.on_failure(entry['video_id'], entry['label'], reason)
+                except Exception as e:
+                    logger.error(f"Upload failure handler raised: {e}")
+
+        # Only now, so wait() returns after the failure has been handed over
+        with self._cond:
+            self._videos.pop(entry['video_id'], None)
+            self._cond.notify_all()
+
+    def _classify(self, response):
+        """
+        Map one batch response to (state, phase, reason)
+
+        state is 'published', 'failed' or 'pending'; phase is a short
+        description used to notice progress between polls.
+        """
+        try:
+            body = json.loads(response.get('body') or '{}')
+        except (TypeError, ValueError):
+            body = {}
+        code = response.get('code')
+
+        if code != 200:
+            error = body.get('error', {})
+            if code == 429 or (code or 500) >= 500 or error.get('code') in self.THROTTLE_CODES:
+                return 'pending', 'throttled', None
+            return 'failed', 'error', error.get('message') or f"HTTP {code}"
+
+        status = body.get('status', {})
+        video_status = status.get('video_status')
+        phases = {name: status.get(f"{name}_phase") or {} for name in ('uploading', 'processing', 'publishing')}
+
+        for name, phase in phases.items():
+            if phase.get('status') == 'error':
+                errors = phase.get('errors') or [{}]
+                return 'failed', name, f"{name} error: {errors[0].get('message', 'unknown')}"
+        if video_status == 'error':
+            return 'failed', 'error', "video status error"
+
+        publishing = phases['publishing']
+        if video_status == 'ready' and publishing.get('status', 'complete') == 'complete':
+            return 'published', 'published', None
+
+        return 'pending', f"{video_status}/{phases['processing'].get('status')}/{publishing.get('status')}", None
+
+    def _record(self, entry, state, elapsed, reason):
+        record = {
+            'video_id': entry['video_id'],
+            'episode': entry['label'],
+            'state': state,
+            'uploaded_at': datetime.fromtimestamp(entry['uploaded_at']).isoformat(timespec='seconds'),
+            'resolved_at': datetime.now().isoformat(timespec='seconds'),
+            'seconds': round(elapsed, 1),
+        }
+        if reason:
+            record['reason'] = reason
+        try:
+            os.makedirs(os.path.dirname(self.log_path) or '.', exist_ok=True)
+            with open(self.log_path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+        except OSError as e:
+            logger.warning(f"Could not write publish log {self.log_path}: {e}")
@@ -1,12 +1,69 @@
-import subprocess
 import json
-from utils.logger import setup_logger
+import math
+import os
+import socket
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from modules.audio_mixer import AudioMixer
+from modules.keyframe_index import KeyframeIndex
+from modules.loudness_analyzer import LoudnessAnalyzer
+from utils.ffmpeg_runner import FFmpegRunner
+from utils.logger import setup_logger, with_log_context
+from utils.artifact import as_path
+from utils.media_probe import media_probe
 
 logger = setup_logger()
 
 class VideoAssembler:
     def __init__(self, config):
         self.config = config
+        self.profile_path = os.path.join(config.ENCODING_PROFILE_DIR, f"{socket.gethostname()}.json")
+        self.encoding_profile = self._load_encoding_profile()
+        self.audio_mixer = AudioMixer(config) if config.USE_NUMPY_MIXER else None
+        self.loudness = LoudnessAnalyzer(config) if config.USE_LOUDNESS_PROFILES else None
+        self.keyframe_index = KeyframeIndex(config.KEYFRAME_INDEX_DIR)
+        self.ffmpeg = FFmpegRunner(
+            stall_timeout=config.FFMPEG_STALL_TIMEOUT,
+            max_retries=config.FFMPEG_MAX_RETRIES,
+            stderr_lines=config.FFMPEG_STDERR_LINES
+        )
+        # Live progress of the current render: out_time, fps, speed, percent, eta
+        self.progress = {}
+        self.upload_video_kbps = self._upload_video_kbps()
+    
+    def _upload_video_kbps(self):
+        """
+        Video bitrate cap from the uplink budget, or None for CRF-only
+        
+        Target bytes/s = uplink * UPLOAD_TIME_RATIO / 8, minus the audio track.
+        CRF still drives quality on easy content; the VBV cap only bites on
+        high-motion clips that would otherwise blow the upload time.
+        """
+        if not self.config.UPLOAD_BANDWIDTH_KBPS:
+            return None
+        total_kbps = self.config.UPLOAD_BANDWIDTH_KBPS * self.config.UPLOAD_TIME_RATIO
+        video_kbps = int(total_kbps - self.config.AUDIO_BITRATE_KBPS)
+        if video_kbps < 200:
+            logger.warning(f"Uplink budget leaves only {video_kbps}kbps for video, using 200kbps")
+            video_kbps = 200
+        logger.info(f"Upload-aware encoding: video capped at {video_kbps}kbps "
+                    f"(~{(video_kbps + self.config.AUDIO_BITRATE_KBPS) * 125 / 1024:.0f} KB/s of output)")
+        return video_kbps
+    
+    def _load_encoding_profile(self):
+        """Load this host's calibrated encoder settings (see EncoderCalibrator)"""
+        profile = {'preset': 'medium', 'crf': 23, 'threads': 0}
+        if os.path.exists(self.profile_path):
+            try:
+                with open(self.profile_path, 'r') as f:
+                    data = json.load(f)
+                profile.update({k: data[k] for k in profile if k in data})
+                logger.info(f"Loaded encoding profile: preset={profile['preset']} crf={profile['crf']} "
+                            f"threads={profile['threads'] or 'auto'}")
+            except Exception as e:
+                logger.warning(f"Could not load encoding profile {self.profile_path}: {e}")
+        return profile
     
     def _escape_ffmpeg_text(self, text: str) -> str:
         """
@@ -22,7 +79,30 @@ class VideoAssembler:
         text = text.replace(']', '\\]')    # Right bracket
         return text
     
-    def assemble_video(self, video_path, audio_path, music_path, subtitle_path, output_path, title=""):
+    def assemble_video(self, video_path, audio_path, music_path, subtitle_path, output_path, title="",
+                       variants=None, draft=False, max_seconds=None, fragment_sink=None, video_key=None):
+        """
+        Render the episode
+        
+        Args:
+            variants: Extra outputs rendered from the same decode, each a dict
+                with 'name', 'resolution' and optional 'crf' / 'maxrate'.
+                Written next to output_path (see variant_output_path).
+            draft: Fast preview render (DRAFT_SCALE resolution, DRAFT_FPS,
+                ultrafast); variants and segmenting are ignored
+            max_seconds: Only render the first N seconds
+            fragment_sink: Callable fed the main output's bytes while it is
+                encoded (fragmented MP4), for progressive upload
+            video_key: Content key of the background, for its keyframe index
+        
+        audio_path and subtitle_path may be Artifacts. The narration stays in
+        memory through probing, loudness and the in-process mix; it is only
+        written out when FFmpeg has to mix it. The subtitles filter needs a
+        file, so the SRT is always materialised.
+        
+        Returns:
+            str: output_path
+        """
         logger.info("Assembling video with Whisper-synced subtitles + static title")
         
         audio_duration = self._get_duration(audio_path)
@@ -31,133 +111,84 @@ class VideoAssembler:
         logger.info(f"Audio: {audio_duration:.2f}s, Video: {video_duration:.2f}s")
         logger.info(f"Title caption: {title}")
         
-        width, height = self.config.OUTPUT_RESOLUTION
+        render_duration = min(audio_duration, max_seconds) if max_seconds else audio_duration
+        if draft:
+            logger.info(f"Draft render: {render_duration:.2f}s")
+            variants = None
         
-        # Escape paths for subtitles (different escaping rules)
-        subtitle_path_escaped = subtitle_path.replace('\\', '/').replace(':', '\\:')
-        
-        # Escape title text for drawtext filter (strict escaping)
-        title_escaped = self._escape_ffmpeg_text(title)
-        
-        logger.debug(f"Original title: {title}")
-        logger.debug(f"Escaped title: {title_escaped}")
+        # Start the background at a random keyframe so episodes don't all open the same way
+        start_offset = 0.0
+        if self.config.RANDOM_BACKGROUND_OFFSET:
+            try:
+                start_offset = self.keyframe_index.pick_start_offset(video_path, video_duration, audio_duration,
+                                                                     key=video_key)
+                logger.info(f"Background starts at keyframe {start_offset:.2f}s")
+            except Exception as e:
+                logger.warning(f"Keyframe index unavailable, starting at 0s: {e}")
         
         # Check if music has audio
         has_music_audio = self._has_audio_stream(music_path)
-        
-        if has_music_audio:
-            # WITH MUSIC - Whisper subtitles + title caption
-            filter_complex = (
-                # Scale and crop video
-                f"[0:v]scale={width}:{height}:force_original_aspect_ratio=increase,"
-                f"crop={width}:{height}[v_crop];"
-                
-                # Add Whisper-synced subtitles (middle of screen)
-                f"[v_crop]subtitles={subtitle_path_escaped}:"
-                f"force_style='FontName=Arial,FontSize={self.config.SUBTITLE_FONT_SIZE},"
-                f"Bold=1,PrimaryColour=&H00FFFFFF,OutlineColour=&H00000000,"
-                f"BackColour=&H80000000,Outline=2,Shadow=1,MarginV=80,Alignment=2'[v_sub];"
-                
-                # Add static title caption at bottom
-                f"[v_sub]drawtext="
-                f"text='{title_escaped}':"
-                f"fontfile=/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf:"
-                f"fontsize={self.config.SUBTITLE_FONT_SIZE}:"
-                f"fontcolor=white:"
-                f"borderw=2:"
-                f"bordercolor=black:"
-                f"x=(w-text_w)/2:"
-                f"y=h-{self.config.SUBTITLE_FONT_SIZE*3}[v];"
-                
-                # Voice audio with volume boost
-                f"[1:a]volume={self.config.VOICE_VOLUME_BOOST}[voice];"
-                
-                # Music audio: loop and adjust volume
-                f"[2:a]aloop=loop=-1:size=2e+09,volume={self.config.MUSIC_VOLUME}[music];"
-                
-                # Mix voice and music
-                f"[voice][music]amix=inputs=2:duration=first:dropout_transition=2[a]"
-            )
-            
-            cmd = [
-                'ffmpeg', '-y',
-                '-stream_loop', '-1',
-                '-i', video_path,
-                '-i', audio_path,
-                '-i', music_path,
-                '-filter_complex', filter_complex,
-                '-map', '[v]',
-                '-map', '[a]',
-                '-t', str(audio_duration),
-                '-c:v', 'libx264',
-                '-preset', 'medium',
-                '-crf', '23',
-                '-pix_fmt', 'yuv420p',
-                '-c:a', 'aac',
-                '-b:a', '128k',
-                '-ar', '44100',
-                '-movflags', '+faststart',
-                output_path
-            ]
-        else:
-            # WITHOUT MUSIC - Whisper subtitles + title caption
+        if not has_music_audio:
             logger.warning("Music has no audio, using voice only")
-            filter_complex = (
-                # Scale and crop video
-                f"[0:v]scale={width}:{height}:force_original_aspect_ratio=increase,"
-                f"crop={width}:{height}[v_crop];"
-                
-                # Add Whisper-synced subtitles (middle of screen)
-                f"[v_crop]subtitles={subtitle_path_escaped}:"
-                f"force_style='FontName=Arial,FontSize={self.config.SUBTITLE_FONT_SIZE},"
-                f"Bold=1,PrimaryColour=&H00FFFFFF,OutlineColour=&H00000000,"
-                f"BackColour=&H80000000,Outline=2,Shadow=1,MarginV=80,Alignment=2'[v_sub];"
-                
-                # Add static title caption at bottom
-                f"[v_sub]drawtext="
-                f"text='{title_escaped}':"
-                f"fontfile=/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf:"
-                f"fontsize={self.config.SUBTITLE_FONT_SIZE}:"
-                f"fontcolor=white:"
-                f"borderw=2:"
-                f"bordercolor=black:"
-                f"x=(w-text_w)/2:"
-                f"y=h-{self.config.SUBTITLE_FONT_SIZE*3}[v];"
-                
-                # Voice audio with volume boost
-                f"[1:a]volume={self.config.VOICE_VOLUME_BOOST}[a]"
-            )
-            
-            cmd = [
-                'ffmpeg', '-y',
-                '-stream_loop', '-1',
-                '-i', video_path,
-                '-i', audio_path,
-                '-filter_complex', filter_complex,
-                '-map', '[v]',
-                '-map', '[a]',
-                '-t', str(audio_duration),
-                '-c:v', 'libx264',
-                '-preset', 'medium',
-                '-crf', '23',
-                '-pix_fmt', 'yuv420p',
-                '-c:a', 'aac',
-                '-b:a', '128k',
-                '-ar', '44100',
-                '-movflags', '+faststart',
-                output_path
-            ]
+        music_input = music_path if has_music_audio else None
+        
+        # Fixed gains from the stored loudness profiles (no loudnorm pass)
+        gains = None
+        if self.loudness:
+            try:
+                gains = self.loudness.mix_gains(audio_path, music_input)
+            except Exception as e:
+                logger.warning(f"Loudness profiles unavailable, using fixed volumes: {e}")
+        
+        # Pre-mix voice + music in-process so the render graph has no audio filters
+        soundtrack_path = audio_path
+        premixed = False
+        # (drafts mix in FFmpeg: only the first seconds are needed)
+        if music_input and self.audio_mixer and not draft:
+            try:
+                soundtrack_path = self.audio_mixer.mix(audio_path, music_input, *(gains or ()))
+                music_input = None
+                premixed = True
+            except Exception as e:
+                logger.warning(f"In-process mix failed, mixing in FFmpeg instead: {e}")
+        
+        if not premixed:
+            soundtrack_path = as_path(soundtrack_path)
+        subtitle_path = as_path(subtitle_path)
         
         try:
-            logger.info("Running FFmpeg with Whisper subtitles + title...")
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            if draft:
+                self._render_single(
+                    video_path, soundtrack_path, music_input, subtitle_path, output_path,
+                    title, render_duration, premixed=premixed, start_offset=start_offset, draft=True,
+                    fragment_sink=fragment_sink, gains=gains
+                )
+            elif self.config.RENDER_SEGMENTS > 1 and not variants:
+                self._render_segmented(
+                    video_path, soundtrack_path, music_input, subtitle_path, output_path,
+                    title, render_duration, video_duration, premixed, start_offset, gains
+                )
+                if fragment_sink:
+                    # Segments are joined at the end, so there is nothing to overlap with
+                    self._feed_file(output_path, fragment_sink)
+            else:
+                if variants and self.config.RENDER_SEGMENTS > 1:
+                    logger.info("Output variants requested, rendering in a single process")
+                self._render_single(
+                    video_path, soundtrack_path, music_input, subtitle_path, output_path,
+                    title, render_duration, variants, premixed, start_offset,
+                    fragment_sink=fragment_sink, gains=gains
+                )
             
             # Verify output
             output_duration = self._get_duration(output_path)
-            logger.info(f"✓ Output duration: {output_duration:.2f}s (expected: {audio_duration:.2f}s)")
+            logger.info(f"✓ Output duration: {output_duration:.2f}s (expected: {render_duration:.2f}s)")
             
-            if abs(output_duration - audio_duration) > 1.0:
-                logger.warning(f"Duration mismatch! Expected {audio_duration:.2f}s, got {output_duration:.2f}s")
+            if abs(output_duration - render_duration) > 1.0:
+                logger.warning(f"Duration mismatch! Expected {render_duration:.2f}s, got {output_duration:.2f}s")
+            
+            for variant in variants or []:
+                logger.info(f"✓ Variant '{variant['name']}': {self.variant_output_path(output_path, variant)}")
             
             logger.info(f"Video assembled successfully: {output_path}")
             return output_path
@@ -169,24 +200,398 @@ class VideoAssembler:
             logger.error(f"Error assembling video: {e}")
             raise
     
-    def _get_duration(self, file_path):
-        cmd = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'json', file_path]
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        data = json.loads(result.stdout)
-        return float(data['format']['duration'])
+    def _set_progress(self, progress):
+        self.progress = progress
     
-    def _has_audio_stream(self, file_path):
-        """Check if file has an audio stream"""
+    def variant_output_path(self, output_path, variant):
+        """Where a named output variant is written, e.g. output_x_reels.mp4"""
+        base, ext = os.path.splitext(output_path)
+        return f"{base}_{variant['name']}{ext}"
+    
+    def _render_single(self, video_path, audio_path, music_path, subtitle_path, output_path, title, audio_duration,
+                       variants=None, premixed=False, start_offset=0.0, draft=False, fragment_sink=None,
+                       gains=None):
+        """
+        Render the whole episode with one FFmpeg process
+        
+        With variants, the background is decoded and captioned once at the
+        largest requested resolution, then split into per-variant branches
+        that are only scaled and encoded.
+        
+        With premixed, audio_path is the final soundtrack (see AudioMixer)
+        and is stream-copied without any audio filters.
+        
+        start_offset is an input seek into the background (a keyframe from
+        KeyframeIndex, so the seek costs no extra decoding).
+        
+        draft renders a single low-resolution, low-fps, ultrafast output.
+        
+        With fragment_sink, the main output is written as fragmented MP4
+        through a FIFO: every byte is appended to output_path and passed to
+        the sink as soon as FFmpeg emits it. A non-seekable output guarantees
+        FFmpeg never goes back to rewrite bytes that were already sent.
+        """
+        fps = None
+        preset = None
+        if draft:
+            width, height = self.config.OUTPUT_RESOLUTION
+            # libx264 needs even dimensions
+            draft_resolution = (int(width * self.config.DRAFT_SCALE) // 2 * 2,
+                                int(height * self.config.DRAFT_SCALE) // 2 * 2)
+            outputs = [(output_path, {'resolution': draft_resolution, 'crf': self.config.DRAFT_CRF})]
+            fps = self.config.DRAFT_FPS
+            preset = 'ultrafast'
+        else:
+            outputs = [(output_path, {'resolution': self.config.OUTPUT_RESOLUTION})]
+            outputs += [(self.variant_output_path(output_path, v), v) for v in variants or []]
+        canvas = max((tuple(v['resolution']) for _, v in outputs), key=lambda r: r[0] * r[1])
+        
+        # Whisper subtitles + title caption, with or without music
+        graph = [self._build_video_filter(video_path, subtitle_path, title, fps=fps, canvas=canvas)]
+        if not premixed:
+            graph.append(self._build_audio_filter(music_path is not None, gains))
+        if len(outputs) > 1:
+            graph.append(self._build_split_filter([v['resolution'] for _, v in outputs], canvas,
+                                                  split_audio=not premixed))
+        filter_complex = ';'.join(graph)
+        
+        cmd = ['ffmpeg', '-y', '-stream_loop', '-1']
+        if start_offset:
+            cmd += ['-ss', f"{start_offset:.6f}"]
+        cmd += [
+            '-i', video_path,
+            '-i', audio_path,
+        ]
+        if music_path:
+            cmd += self._music_input_args(music_path)
+        cmd += ['-filter_complex', filter_complex]
+        
+        fifo_path = f"{output_path}.fifo" if fragment_sink else None
+        
+        # One encoder per branch
+        for k, (path, variant) in enumerate(outputs):
+            video_label, audio_label = ('[v]', '[a]') if len(outputs) == 1 else (f'[v{k}]', f'[a{k}]')
+            if premixed:
+                audio_label = '1:a'
+            fragmented = fifo_path is not None and k == 0
+            cmd += [
+                '-map', video_label,
+                '-map', audio_label,
+                '-t', str(audio_duration),
+            ] + self._encode_args(crf=variant.get('crf'), maxrate=variant.get('maxrate'), premixed=premixed,
+                                  preset=preset, fragmented=fragmented, upload=k == 0)
+            cmd += ['-f', 'mp4', fifo_path] if fragmented else [path]
+        
+        logger.info("Running FFmpeg with Whisper subtitles + title...")
+        if not fifo_path:
+            self.ffmpeg.run(cmd, duration=audio_duration, label="Render", on_progress=self._set_progress)
+            return
+        
+        os.mkfifo(fifo_path)
+        copier = _FifoCopier(fifo_path, output_path, fragment_sink)
+        copier.start()
+        try:
+            # No retry: the sink already holds the partial stream and the copier
+            # is gone, so a second attempt could only block or corrupt the upload
+            self.ffmpeg.run(cmd, duration=audio_duration, label="Render", on_progress=self._set_progress,
+                            max_retries=0, paused=lambda: copier.in_sink)
+        finally:
+            copier.finish()
+            os.remove(fifo_path)
+    
+    def _feed_file(self, path, sink, chunk_size=1024 * 1024):
+        try:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b''):
+                    sink(chunk)
+        except Exception as e:
+            logger.warning(f"Fragment sink failed: {e}")
+    
+    def _render_segmented(self, video_path, audio_path, music_path, subtitle_path, output_path, title,
+                          audio_duration, video_duration, premixed=False, start_offset=0.0, gains=None):
+        """
+        Render the timeline as N video-only segments in parallel, then join
+        them with the concat demuxer (-c copy) and mux the audio once.
+        
+        Segment boundaries sit on the frame grid and every segment's
+        timestamps are shifted to episode time before the subtitles filter,
+        so subtitle timing is identical to a single-process render.
+        """
+        fps = media_probe.probe(video_path)['fps'] or self.config.PROXY_FPS
+        total_frames = int(math.ceil(audio_duration * fps))
+        n_segments = max(1, min(self.config.RENDER_SEGMENTS, total_frames // int(fps)))
+        threads = max(1, (os.cpu_count() or 1) // n_segments)
+        
+        # Split frames as evenly as possible: [start_frame, frame_count]
+        base, extra = divmod(total_frames, n_segments)
+        ranges = []
+        start_frame = 0
+        for i in range(n_segments):
+            count = base + (1 if i < extra else 0)
+            ranges.append((start_frame, count))
+            start_frame += count
+        
+        logger.info(f"Segmented render: {n_segments} segments x {threads} threads @ {fps:g}fps")
+        
+        segment_paths = [f"{output_path}.seg{i}.mp4" for i in range(n_segments)]
+        list_path = f"{output_path}.segments.txt"
+        
+        def render_segment(i):
+            seg_start, seg_frames = ranges[i]
+            start = seg_start / fps
+            # -stream_loop wraps to the file start, so seek within the first loop
+            seek = (start_offset + start) % video_duration if video_duration > 0 else 0.0
+            cmd = [
+                'ffmpeg', '-y',
+                '-stream_loop', '-1',
+                '-ss', f"{seek:.6f}",
+                '-i', video_path,
+                '-filter_complex', self._build_video_filter(video_path, subtitle_path, title, start=start, fps=fps),
+                '-map', '[v]',
+                '-frames:v', str(seg_frames),
+                '-an',
+            ] + self._video_encode_args(threads=threads, upload=True) + [segment_paths[i]]
+            self.ffmpeg.run(cmd, duration=seg_frames / fps, label=f"Segment {i + 1}/{n_segments}")
+            logger.info(f"✓ Segment {i + 1}/{n_segments} rendered ({start:.2f}s +{seg_frames / fps:.2f}s)")
+        
         try:
+            with ThreadPoolExecutor(max_workers=n_segments) as pool:
+                # list() re-raises the first segment failure
+                list(pool.map(with_log_context(render_segment), range(n_segments)))
+            
+            with open(list_path, 'w') as f:
+                for path in segment_paths:
+                    f.write(f"file '{os.path.abspath(path)}'\n")
+            
             cmd = [
-                'ffprobe', '-v', 'error',
-                '-select_streams', 'a:0',
-                '-show_entries', 'stream=codec_type',
-                '-of', 'json',
-                file_path
+                'ffmpeg', '-y',
+                '-f', 'concat', '-safe', '0',
+                '-i', list_path,
+                '-i', audio_path,
             ]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            data = json.loads(result.stdout)
-            return len(data.get('streams', [])) > 0
-        except:
-            return False
+            if music_path:
+                cmd += self._music_input_args(music_path)
+            if premixed:
+                cmd += ['-map', '0:v', '-map', '1:a']
+            else:
+                cmd += [
+                    '-filter_complex', self._build_audio_filter(music_path is not None, gains),
+                    '-map', '0:v',
+                    '-map', '[a]',
+                ]
+            cmd += [
+                '-t', str(audio_duration),
+                '-c:v', 'copy',
+            ] + self._audio_encode_args(premixed) + ['-movflags', '+faststart', output_path]
+            
+            logger.info("Joining segments and muxing audio...")
+            self.ffmpeg.run(cmd, duration=audio_duration, label="Concat", on_progress=self._set_progress)
+        finally:
+            for path in segment_paths + [list_path]:
+                if os.path.exists(path):
+                    os.remove(path)
+    
+    def _build_video_filter(self, video_path, subtitle_path, title, start=0.0, fps=None, canvas=None):
+        """
+        Build the video part of the filter graph, ending in the [v] label
+        
+        Scaling is skipped when the background already matches the output
+        resolution (e.g. a pre-transcoded proxy from ProxyCache).
+        
+        For segmented renders, start shifts frame timestamps to episode time
+        while subtitles are burned in and fps pins the frame grid.
+        
+        canvas overrides the resolution captions are burned at; the title
+        font is scaled with it (subtitle styles scale with height already).
+        """
+        width, height = canvas or self.config.OUTPUT_RESOLUTION
+        font_size = round(self.config.SUBTITLE_FONT_SIZE * height / self.config.OUTPUT_RESOLUTION[1])
+        
+        # Escape paths for subtitles (different escaping rules)
+        subtitle_path_escaped = subtitle_path.replace('\\', '/').replace(':', '\\:')
+        
+        # Escape title text for drawtext filter (strict escaping)
+        title_escaped = self._escape_ffmpeg_text(title)
+        
+        logger.debug(f"Original title: {title}")
+        logger.debug(f"Escaped title: {title_escaped}")
+        
+        # Segment timing: shift to episode time, then back to zero at the end
+        pre = ""
+        post = ""
+        if fps:
+            pre += f"fps={fps},"
+        if start:
+            pre = f"setpts=PTS-STARTPTS+{start:.6f}/TB," + pre
+            post = ",setpts=PTS-STARTPTS"
+        
+        if media_probe.get_resolution(video_path) == (width, height):
+            logger.debug(f"Background already {width}x{height}, skipping scale/crop")
+            video_filter = f"[0:v]{pre}null[v_crop];"
+        else:
+            # Scale and crop video
+            video_filter = (
+                f"[0:v]{pre}scale={width}:{height}:force_original_aspect_ratio=increase,"
+                f"crop={width}:{height}[v_crop];"
+            )
+        
+        return video_filter + (
+            # Add Whisper-synced subtitles (middle of screen)
+            f"[v_crop]subtitles={subtitle_path_escaped}:"
+            f"force_style='FontName=Arial,FontSize={self.config.SUBTITLE_FONT_SIZE},"
+            f"Bold=1,PrimaryColour=&H00FFFFFF,OutlineColour=&H00000000,"
+            f"BackColour=&H80000000,Outline=2,Shadow=1,MarginV=80,Alignment=2'[v_sub];"
+            
+            # Add static title caption at bottom
+            f"[v_sub]drawtext="
+            f"text='{title_escaped}':"
+            f"fontfile=/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf:"
+            f"fontsize={font_size}:"
+            f"fontcolor=white:"
+            f"borderw=2:"
+            f"bordercolor=black:"
+            f"x=(w-text_w)/2:"
+            f"y=h-{font_size*3}{post}[v]"
+        )
+    
+    def _build_split_filter(self, resolutions, canvas, split_audio=True):
+        """Split [v]/[a] into one branch per output, scaling branches smaller than the canvas"""
+        n = len(resolutions)
+        video_labels = ''.join(f'[vs{k}]' for k in range(n))
+        audio_labels = ''.join(f'[a{k}]' for k in range(n))
+        
+        branches = [f"[v]split={n}{video_labels}"]
+        for k, (w, h) in enumerate(resolutions):
+            if (w, h) == tuple(canvas):
+                branches.append(f"[vs{k}]null[v{k}]")
+            else:
+                branches.append(
+                    f"[vs{k}]scale={w}:{h}:force_original_aspect_ratio=increase,crop={w}:{h}[v{k}]"
+                )
+        if split_audio:
+            branches.append(f"[a]asplit={n}{audio_labels}")
+        return ';'.join(branches)
+    
+    def _music_input_args(self, music_path):
+        """
+        Loop the music at the demuxer instead of with aloop, which buffers
+        the whole track in memory (size=2e+09 samples). amix duration=first
+        still ends the bed at the end of the voice track.
+        """
+        return ['-stream_loop', '-1', '-i', music_path]
+    
+    def _build_audio_filter(self, has_music, gains=None):
+        """
+        Build the audio part of the filter graph (input 1 = voice, 2 = music), ending in [a]
+        
+        gains is (voice, music) from LoudnessAnalyzer.mix_gains; without it
+        the configured VOICE_VOLUME_BOOST / MUSIC_VOLUME are used.
+        """
+        voice_gain, music_gain = gains or (self.config.VOICE_VOLUME_BOOST, self.config.MUSIC_VOLUME)
+        if not has_music:
+            # Voice audio with volume boost
+            return f"[1:a]volume={voice_gain:.4f}[a]"
+        
+        return (
+            # Voice audio with volume boost
+            f"[1:a]volume={voice_gain:.4f}[voice];"
+            
+            # Music audio (looped at the input, see _music_input_args): adjust volume
+            f"[2:a]volume={music_gain:.4f}[music];"
+            
+            # Mix voice and music
+            f"[voice][music]amix=inputs=2:duration=first:dropout_transition=2[a]"
+        )
+    
+    def _encode_args(self, crf=None, maxrate=None, premixed=False, preset=None, fragmented=False,
+                     upload=False):
+        """Output encoder settings shared by every render"""
+        # faststart rewrites the file at the end; fragmented MP4 is written strictly in order
+        movflags = '+frag_keyframe+empty_moov+default_base_moof' if fragmented else '+faststart'
+        return (self._video_encode_args(crf=crf, maxrate=maxrate, preset=preset, upload=upload) +
+                self._audio_encode_args(premixed) + ['-movflags', movflags])
+    
+    def _video_encode_args(self, threads=None, crf=None, maxrate=None, preset=None, upload=False):
+        """libx264 settings; the uplink bitrate cap only applies to the output that is uploaded"""
+        profile = self.encoding_profile
+        args = [
+            '-c:v', 'libx264',
+            '-preset', preset or profile['preset'],
+            '-crf', str(crf if crf is not None else profile['crf']),
+            '-pix_fmt', 'yuv420p',
+        ]
+        if not maxrate and upload and self.upload_video_kbps:
+            maxrate = f"{self.upload_video_kbps}k"
+        if maxrate:
+            # Bitrate cap: VBV buffer of twice the max rate
+            args += ['-maxrate', str(maxrate), '-bufsize', self._double_rate(maxrate)]
+        threads = threads or profile['threads']
+        if threads:
+            args += ['-threads', str(threads)]
+        return args
+    
+    def _double_rate(self, rate):
+        """'2500k' -> '5000k', 3000000 -> '6000000'"""
+        rate = str(rate)
+        if rate[-1:].lower() in ('k', 'm'):
+            return f"{float(rate[:-1]) * 2:g}{rate[-1]}"
+        return str(int(float(rate) * 2))
+    
+    def _audio_encode_args(self, premixed=False):
+        if premixed:
+            # AudioMixer already produced AAC at AUDIO_BITRATE_KBPS / 44.1kHz
+            return ['-c:a', 'copy']
+        return [
+            '-c:a', 'aac',
+            '-b:a', f"{self.config.AUDIO_BITRATE_KBPS}k",
+            '-ar', '44100',
+        ]
+    
+    def _get_duration(self, file_path):
+        return media_probe.get_duration(file_path)
+    
+    def _has_audio_stream(self, file_path):
+        """Check if file has an audio stream"""
+        return media_probe.has_audio_stream(file_path)
+
+
+class _FifoCopier:
+    """Drains FFmpeg's FIFO output into the output file and a sink"""
+
+    def __init__(self, fifo_path, output_path, sink, chunk_size=256 * 1024):
+        self.fifo_path = fifo_path
+        self.output_path = output_path
+        self.sink = sink
+        self.chunk_size = chunk_size
+        self.error = None
+        self.in_sink = False  # True while the sink blocks (upload backpressure)
+        self._thread = threading.Thread(target=with_log_context(self._run), daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def finish(self):
+        if self._thread.is_alive():
+            # FFmpeg may have died before opening the FIFO; open the write
+            # end once so the blocked reader sees EOF
+            try:
+                os.close(os.open(self.fifo_path, os.O_WRONLY | os.O_NONBLOCK))
+            except OSError:
+                pass
+        self._thread.join()
+
+    def _run(self):
+        with open(self.fifo_path, 'rb') as src, open(self.output_path, 'wb') as dst:
+            for chunk in iter(lambda: src.read(self.chunk_size), b''):
+                dst.write(chunk)
+                if self.error:
+                    # Keep draining so FFmpeg never blocks on a dead sink
+                    continue
+                self.in_sink = True
+                try:
+                    self.sink(chunk)
+                except Exception as e:
+                    logger.warning(f"Fragment sink failed, finishing render without it: {e}")
+                    self.error = e
+                finally:
+                    self.in_sink = False
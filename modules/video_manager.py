@@ -1,4 +1,3 @@
-import requests
 import os
 from utils.logger import setup_logger
 
@@ -6,39 +5,43 @@ logger = setup_logger()
 
 
 class VideoManager:
-    """Manages video rotation and downloading"""
+    """Downloads background clips (selection lives in BackgroundLibrary)"""
 
-    def __init__(self, video_urls: list):
-        self.video_urls = video_urls
+    def __init__(self, asset_cache):
+        self.asset_cache = asset_cache
 
-    def download_video(self, index: int, output_path: str) -> str:
+    def download_video(self, url: str, output_path: str, sha256: str = None) -> str:
         """
-        Download video at the given index
+        Download a background clip
+
+        The clip comes from the asset cache (revalidated with ETag /
+        If-Modified-Since) and is exposed at output_path as a hardlink, so
+        unchanged clips cost no network bytes and no copy.
 
         Args:
-            index: Index of video to download
+            url: Clip URL
             output_path: Path to save video
+            sha256: Expected content hash (from the manifest), if known
 
         Returns:
-            str: Path to downloaded video
+            str: Path to downloaded video (output_path, or the cache path if
+                it cannot be hardlinked)
         """
-        url = self.video_urls[index]
-        logger.info(f"Downloading video {index + 1}/{len(self.video_urls)}: {url}")
+        logger.info(f"Downloading video: {url}")
 
         try:
-            response = requests.get(url, stream=True, timeout=60)
-            response.raise_for_status()
-
-            with open(output_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            video_path = self.asset_cache.link(url, output_path, sha256)
 
-            if not os.path.exists(output_path):
-                raise FileNotFoundError(f"Video not downloaded: {output_path}")
+            if not os.path.exists(video_path):
+                raise FileNotFoundError(f"Video not downloaded: {video_path}")
 
-            logger.info(f"Video downloaded successfully: {output_path}")
-            return output_path
+            logger.info(f"Video ready: {video_path}")
+            return video_path
 
         except Exception as e:
             logger.error(f"Error downloading video: {e}")
-            raise
\ No newline at end of file
+            raise
+
+    def content_key(self, url: str):
+        """Content hash of the cached clip (changes when the clip does)"""
+        return self.asset_cache.content_hash(url)
\ No newline at end of file
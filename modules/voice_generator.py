@@ -1,6 +1,7 @@
 import asyncio
 import edge_tts
 import os
+from utils.artifact import Artifact
 from utils.logger import setup_logger
 
 logger = setup_logger()
@@ -20,7 +21,7 @@ class VoiceGenerator:
                 rate=self.rate,
                 volume=self.volume
             )
-            await communicate.save(output_path)
+            await self._save(communicate, output_path)
         except Exception as e:
             # Try multiple fallback voices
             logger.warning(f"Failed with {self.voice}: {e}")
@@ -41,7 +42,7 @@ class VoiceGenerator:
                         rate=self.rate,
                         volume=self.volume
                     )
-                    await communicate.save(output_path)
+                    await self._save(communicate, output_path)
                     logger.info(f"Success with {fallback_voice}")
                     return
                 except Exception as fallback_error:
@@ -50,12 +51,33 @@ class VoiceGenerator:
             
             raise Exception("All voice generation attempts failed")
     
+    async def _save(self, communicate, output):
+        """Write the synthesized audio to a path, or stream it into an Artifact"""
+        if not isinstance(output, Artifact):
+            await communicate.save(output)
+            return
+        # A failed voice may have streamed part of the audio already
+        output.reset()
+        async for chunk in communicate.stream():
+            if chunk['type'] == 'audio':
+                output.write(chunk['data'])
+        output.close()
+    
     def generate_voice(self, text: str, output_path: str):
+        """
+        Synthesize the narration
+        
+        Args:
+            output_path: File path, or an Artifact to keep the audio in memory
+        """
         logger.info(f"Generating natural voice narration with {self.voice}")
         try:
             asyncio.run(self._generate_async(text, output_path))
             
-            if not os.path.exists(output_path):
+            if isinstance(output_path, Artifact):
+                if not output_path.size:
+                    raise ValueError(f"No audio received for {output_path}")
+            elif not os.path.exists(output_path):
                 raise FileNotFoundError(f"Voice file not created: {output_path}")
             
             logger.info(f"Voice saved: {output_path}")
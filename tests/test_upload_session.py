@@ -0,0 +1,123 @@
+"""ResumableUpload / ProgressiveUpload against tools/stub_graph_server.py with dropped transfers"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import ThreadingHTTPServer
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'tools')]
+os.environ.setdefault('LOG_DIR', tempfile.mkdtemp(prefix='upload_test_logs_'))
+
+import stub_graph_server as stub  # noqa: E402
+from modules.upload_session import UploadSession, ResumableUpload, ProgressiveUpload  # noqa: E402
+
+SERVER_CHUNK = 768 * 1024
+CLIENT_CHUNK = 1024 * 1024
+FILE_SIZE = 10 * CLIENT_CHUNK + 123
+
+
+class RecordingSession(UploadSession):
+    """Checks that every transfer carries exactly the range the server asked for"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.windows = []
+        self.mismatches = []
+        self._expected = None
+
+    def start(self, file_size=None):
+        self._expected = super().start(file_size)
+        return self._expected
+
+    def transfer(self, offset, chunk):
+        if self._expected and self._expected[1]:
+            if (offset, offset + len(chunk)) != self._expected:
+                self.mismatches.append(((offset, offset + len(chunk)), self._expected))
+        self._expected = super().transfer(offset, chunk)
+        self.windows.append(self._expected)
+        return self._expected
+
+
+class UploadSessionTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        stub.GraphStubHandler.out_dir = cls.tmp.name
+        stub.GraphStubHandler.drop_rate = 0.3
+        stub.GraphStubHandler.chunk_size = SERVER_CHUNK
+        stub.GraphStubHandler._log = lambda self, message: None
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), stub.GraphStubHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.graph_url = f"http://127.0.0.1:{cls.server.server_port}/v18.0"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.tmp.cleanup()
+
+    def setUp(self):
+        random.seed(self._testMethodName)
+        # Resume delays are not what is under test
+        patcher = mock.patch('modules.upload_session.time.sleep')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _make_file(self, name):
+        data = os.urandom(FILE_SIZE)
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path, data
+
+    def _uploaded(self, result):
+        with open(os.path.join(self.tmp.name, f"{result['video_id']}.mp4"), 'rb') as f:
+            return f.read()
+
+    def test_sequential_follows_server_ranges(self):
+        path, data = self._make_file('sequential.mp4')
+        session = RecordingSession(self.graph_url, 'page', 'token')
+        result = ResumableUpload(session, path, CLIENT_CHUNK).upload('title', 'description')
+
+        self.assertEqual(self._uploaded(result), data)
+        self.assertEqual(session.mismatches, [])
+        self.assertFalse(os.path.exists(path + '.upload.json'))
+
+    def test_parallel(self):
+        path, data = self._make_file('parallel.mp4')
+        session = UploadSession(self.graph_url, 'page', 'token')
+        result = ResumableUpload(session, path, CLIENT_CHUNK, parallel=4).upload('title', 'description')
+
+        self.assertEqual(self._uploaded(result), data)
+
+    def test_progressive(self):
+        data = os.urandom(FILE_SIZE)
+        upload = ProgressiveUpload(UploadSession(self.graph_url, 'page', 'token'), CLIENT_CHUNK)
+        with mock.patch.object(UploadSession, 'transfer', autospec=True,
+                               side_effect=self._retrying(UploadSession.transfer)):
+            upload.open()
+            for i in range(0, len(data), 100 * 1024):
+                upload.feed(data[i:i + 100 * 1024])
+            result = upload.close('title', 'description')
+
+        self.assertEqual(self._uploaded(result), data)
+
+    def _retrying(self, transfer):
+        # A progressive upload has no resume: retry dropped transfers in place
+        def call(session, offset, chunk):
+            for _ in range(20):
+                try:
+                    return transfer(session, offset, chunk)
+                except Exception:
+                    continue
+            raise AssertionError("transfer kept failing")
+        return call
+
+
+if __name__ == '__main__':
+    unittest.main()
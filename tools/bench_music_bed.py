@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Peak-RSS benchmark for the music bed: legacy aloop graph vs input looping
+
+Usage: python tools/bench_music_bed.py [--voice-seconds 120] [--music-seconds 300] [--runs 3]
+
+Each case is the full episode render command, built by the assembler's own
+_render_single from short synthetic fixtures (background, subtitles, voice,
+music); the "before" case only swaps the music bed back to aloop. The
+ffmpeg process's own peak RSS is recorded (via os.wait4, so cases do not
+mask each other).
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from modules.video_assembler import VideoAssembler
+
+
+def run_measured(cmd):
+    """Run a command and return (wall seconds, peak RSS in MB) for that process only"""
+    # Quiet ffmpeg so the stderr pipe cannot fill up while we block in wait4
+    cmd = cmd[:1] + ['-v', 'error', '-nostats'] + cmd[1:]
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    _, status, usage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {proc.stderr.read().decode(errors='replace')[-2000:]}")
+    # ru_maxrss is KB on Linux
+    return wall, usage.ru_maxrss / 1024
+
+
+class CapturingRunner:
+    """Stands in for FFmpegRunner: keeps the command instead of running it"""
+
+    def __init__(self):
+        self.commands = []
+
+    def run(self, cmd, **kwargs):
+        self.commands.append(cmd)
+
+
+class LegacyMusicBed(VideoAssembler):
+    """The assembler with the music bed as it was: aloop buffers the whole track"""
+
+    def _music_input_args(self, music_path):
+        return ['-i', music_path]
+
+    def _build_audio_filter(self, has_music, gains=None):
+        return (
+            f"[1:a]volume={self.config.VOICE_VOLUME_BOOST:.4f}[voice];"
+            f"[2:a]aloop=loop=-1:size=2e+09,volume={self.config.MUSIC_VOLUME:.4f}[music];"
+            f"[voice][music]amix=inputs=2:duration=first:dropout_transition=2[a]"
+        )
+
+
+def render_command(assembler, inputs, output_path, duration):
+    """The assembler's real single-process render command for the fixtures"""
+    runner = CapturingRunner()
+    assembler.ffmpeg = runner
+    assembler._render_single(inputs['video'], inputs['voice'], inputs['music'], inputs['subtitles'],
+                             output_path, "Benchmark Episode", duration)
+    return runner.commands[-1]
+
+
+def make_inputs(work_dir, voice_seconds, music_seconds):
+    video_path = os.path.join(work_dir, 'background.mp4')
+    subtitle_path = os.path.join(work_dir, 'subs.srt')
+    voice_path = os.path.join(work_dir, 'voice.mp3')
+    music_path = os.path.join(work_dir, 'music.mp3')
+    # A short background: the render loops it like any clip shorter than the narration
+    subprocess.run([
+        'ffmpeg', '-y', '-f', 'lavfi', '-i', 'testsrc2=size=640x360:rate=30',
+        '-t', '10', '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', video_path
+    ], capture_output=True, check=True)
+    with open(subtitle_path, 'w') as f:
+        f.write("1\n00:00:00,000 --> 00:00:05,000\nBenchmark subtitle\n")
+    subprocess.run([
+        'ffmpeg', '-y', '-f', 'lavfi', '-i', 'sine=frequency=220:sample_rate=24000',
+        '-t', str(voice_seconds), '-c:a', 'libmp3lame', '-b:a', '48k', voice_path
+    ], capture_output=True, check=True)
+    subprocess.run([
+        'ffmpeg', '-y', '-f', 'lavfi', '-i', 'anoisesrc=color=pink:amplitude=0.2:sample_rate=44100',
+        '-ac', '2', '-t', str(music_seconds), '-c:a', 'libmp3lame', '-b:a', '128k', music_path
+    ], capture_output=True, check=True)
+    return {'video': video_path, 'subtitles': subtitle_path, 'voice': voice_path, 'music': music_path}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--voice-seconds', type=int, default=120)
+    parser.add_argument('--music-seconds', type=int, default=300)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_music_bed_')
+    try:
+        inputs = make_inputs(work_dir, args.voice_seconds, args.music_seconds)
+        output_path = os.path.join(work_dir, 'output.mp4')
+        cases = {
+            'before (aloop size=2e+09)': render_command(LegacyMusicBed(Config), inputs, output_path,
+                                                        args.voice_seconds),
+            'after (input -stream_loop)': render_command(VideoAssembler(Config), inputs, output_path,
+                                                         args.voice_seconds),
+        }
+
+        print(f"Voice {args.voice_seconds}s, music {args.music_seconds}s, {args.runs} runs each")
+        for name, cmd in cases.items():
+            results = [run_measured(cmd) for _ in range(args.runs)]
+            peak = max(r[1] for r in results)
+            wall = min(r[0] for r in results)
+            print(f"  {name:<28} peak RSS {peak:8.1f} MB   best wall {wall:6.2f}s")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Local stub of the Graph API video upload endpoints
+
+Usage: python tools/stub_graph_server.py [--port 8765] [--out-dir stub_uploads] [--drop-rate 0.1]
+                                          [--chunk-size 1048576] [--publish-delay 60] [--fail-rate 0.1]
+
+Then run the bot with FACEBOOK_GRAPH_URL=http://127.0.0.1:8765/v18.0 to
+exercise direct uploads and chunked upload sessions (start/transfer/
+finish, including progressive sessions that start without a file_size)
+without touching Facebook. Finished videos are written to --out-dir.
+
+Like Graph, each reply's [start_offset, end_offset) is the next chunk to
+send, at most --chunk-size bytes. Transfers may arrive out of order
+(UPLOAD_PARALLEL_CHUNKS > 1); start_offset is the end of the contiguous
+data received so far. With --drop-rate a fraction of transfers fails with
+a 500, to exercise resuming.
+
+Batch requests (POST /v18.0 with batch=[{"relative_url": "<id>?fields=status"}])
+report each saved video as processing, then publishing, then ready once
+--publish-delay seconds have passed; --fail-rate of them end in a
+processing error instead.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import default as email_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+_ids = itertools.count(1000)
+_sessions = {}
+_videos = {}  # video_id -> (saved at, fails processing)
+_lock = threading.Lock()
+
+
+def parse_form(handler):
+    """Return {field: bytes} for urlencoded or multipart POST bodies"""
+    length = int(handler.headers.get('Content-Length', 0))
+    body = handler.rfile.read(length)
+    content_type = handler.headers.get('Content-Type', '')
+
+    if content_type.startswith('multipart/form-data'):
+        message = BytesParser(policy=email_policy).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body
+        )
+        fields = {}
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            fields[name] = part.get_payload(decode=True) or b''
+        return fields
+
+    return {k: v[0].encode() for k, v in parse_qs(body.decode()).items()}
+
+
+def contiguous_end(ranges):
+    """End of the data received from offset 0 without gaps"""
+    end = 0
+    for start, stop in sorted(ranges):
+        if start > end:
+            break
+        end = max(end, stop)
+    return end
+
+
+class GraphStubHandler(BaseHTTPRequestHandler):
+    out_dir = 'stub_uploads'
+    drop_rate = 0.0
+    chunk_size = 4 * 1024 * 1024
+    publish_delay = 60.0
+    fail_rate = 0.0
+
+    def do_POST(self):
+        path = urlparse(self.path).path.strip('/').split('/')
+        if len(path) == 1:
+            return self._batch(parse_form(self))
+        if len(path) != 3 or path[2] != 'videos':
+            return self._reply(404, {'error': {'message': f'Unknown path {self.path}'}})
+
+        fields = parse_form(self)
+        phase = fields.get('upload_phase', b'').decode()
+
+        if phase == 'start':
+            return self._start(fields)
+        if phase == 'transfer':
+            return self._transfer(fields)
+        if phase == 'finish':
+            return self._finish(fields)
+        if 'source' in fields:
+            video_id = str(next(_ids))
+            self._save(video_id, fields['source'])
+            return self._reply(200, {'id': video_id})
+        return self._reply(400, {'error': {'message': 'Missing source or upload_phase'}})
+
+    def _start(self, fields):
+        size = fields.get('file_size')
+        session = {
+            'video_id': str(next(_ids)),
+            'file_size': int(size) if size else None,
+            'data': bytearray(),
+            'ranges': [],
+        }
+        session_id = str(next(_ids))
+        with _lock:
+            _sessions[session_id] = session
+        self._log(f"start session {session_id} (file_size={session['file_size']})")
+        return self._reply(200, {
+            'video_id': session['video_id'],
+            'upload_session_id': session_id,
+            'start_offset': '0',
+            'end_offset': str(self._chunk_end(session, 0)),
+        })
+
+    def _transfer(self, fields):
+        session = _sessions.get(fields.get('upload_session_id', b'').decode())
+        if session is None:
+            return self._reply(400, {'error': {'message': 'Unknown upload session'}})
+
+        if random.random() < self.drop_rate:
+            self._log(f"dropping transfer at {fields.get('start_offset', b'?').decode()}")
+            return self._reply(500, {'error': {'message': 'Simulated transfer failure'}})
+
+        offset = int(fields['start_offset'])
+        chunk = fields['video_file_chunk']
+        with _lock:
+            data = session['data']
+            if offset > len(data):
+                data.extend(bytes(offset - len(data)))
+            data[offset:offset + len(chunk)] = chunk
+            session['ranges'].append((offset, offset + len(chunk)))
+            received = contiguous_end(session['ranges'])
+
+        return self._reply(200, {'start_offset': str(received), 'end_offset': str(self._chunk_end(session, received))})
+
+    def _chunk_end(self, session, start):
+        # Progressive sessions have no size yet: any amount may follow
+        if session['file_size'] is None:
+            return start
+        return min(session['file_size'], start + self.chunk_size)
+
+    def _finish(self, fields):
+        session_id = fields.get('upload_session_id', b'').decode()
+        session = _sessions.pop(session_id, None)
+        if session is None:
+            return self._reply(400, {'error': {'message': 'Unknown upload session'}})
+
+        expected = session['file_size'] or (int(fields['file_size']) if fields.get('file_size') else None)
+        received = contiguous_end(session['ranges'])
+        if received != len(session['data']):
+            _sessions[session_id] = session
+            return self._reply(400, {'error': {'message': f"Gap after offset {received}"}})
+        if expected is not None and expected != len(session['data']):
+            return self._reply(400, {'error': {'message': f"Size mismatch: {len(session['data'])} != {expected}"}})
+
+        self._save(session['video_id'], session['data'])
+        return self._reply(200, {'success': True})
+
+    def _batch(self, fields):
+        if 'batch' not in fields:
+            return self._reply(400, {'error': {'message': 'Missing batch'}})
+        requests = json.loads(fields['batch'])
+        if len(requests) > 50:
+            return self._reply(400, {'error': {'message': 'Batch limit exceeded (50)', 'code': 1}})
+        self._log(f"batch of {len(requests)} status requests")
+        return self._reply(200, [self._video_status(r['relative_url'].split('?')[0]) for r in requests])
+
+    def _video_status(self, video_id):
+        if video_id not in _videos:
+            error = {'error': {'message': f'Unknown video {video_id}', 'code': 100}}
+            return {'code': 404, 'body': json.dumps(error)}
+        saved_at, fails = _videos[video_id]
+        progress = (time.time() - saved_at) / max(self.publish_delay, 1e-6)
+        if fails and progress >= 0.5:
+            status = {'video_status': 'error',
+                      'processing_phase': {'status': 'error', 'errors': [{'message': 'Simulated processing error'}]}}
+        elif progress < 0.5:
+            status = {'video_status': 'processing', 'processing_phase': {'status': 'in_progress'},
+                      'publishing_phase': {'status': 'not_started'}}
+        elif progress < 1.0:
+            status = {'video_status': 'processing', 'processing_phase': {'status': 'complete'},
+                      'publishing_phase': {'status': 'in_progress'}}
+        else:
+            status = {'video_status': 'ready', 'processing_phase': {'status': 'complete'},
+                      'publishing_phase': {'status': 'complete', 'publish_status': 'published'}}
+        return {'code': 200, 'body': json.dumps({'id': video_id, 'status': status})}
+
+    def _save(self, video_id, data):
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, f"{video_id}.mp4")
+        with open(path, 'wb') as f:
+            f.write(data)
+        _videos[video_id] = (time.time(), random.random() < self.fail_rate)
+        self._log(f"saved video {video_id}: {len(data)} bytes -> {path}")
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _log(self, message):
+        print(f"[stub-graph] {message}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--out-dir', default='stub_uploads')
+    parser.add_argument('--drop-rate', type=float, default=0.0,
+                        help='Fraction of transfers answered with a 500')
+    parser.add_argument('--chunk-size', type=int, default=4 * 1024 * 1024,
+                        help='Largest chunk asked for in end_offset')
+    parser.add_argument('--publish-delay', type=float, default=60.0,
+                        help='Seconds until a saved video reports as published')
+    parser.add_argument('--fail-rate', type=float, default=0.0,
+                        help='Fraction of saved videos that fail processing')
+    args = parser.parse_args()
+
+    GraphStubHandler.out_dir = args.out_dir
+    GraphStubHandler.drop_rate = args.drop_rate
+    GraphStubHandler.chunk_size = args.chunk_size
+    GraphStubHandler.publish_delay = args.publish_delay
+    GraphStubHandler.fail_rate = args.fail_rate
+    server = ThreadingHTTPServer((args.host, args.port), GraphStubHandler)
+    print(f"Stub Graph API on http://{args.host}:{args.port}/v18.0", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
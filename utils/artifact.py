@@ -0,0 +1,103 @@
+import os
+
+
+class Artifact:
+    """
+    Output of one pipeline stage, kept in memory unless it grows too large
+
+    Producers write() bytes; consumers that can take bytes (HTTP uploads,
+    ffmpeg/ffprobe via stdin) use getvalue() or input_source(), and only
+    consumers that need a real file (e.g. the subtitles filter) call
+    materialize(). Past spill_threshold the data is moved to `path` and
+    the artifact behaves like a plain file from then on.
+
+    meta caches values derived from the content (probe, loudness profile),
+    since an in-memory artifact has no sidecar files.
+    """
+
+    def __init__(self, path: str, spill_threshold: int):
+        self.path = path
+        self.spill_threshold = spill_threshold
+        self.meta = {}
+        self._buffer = bytearray()
+        self._file = None
+        self.on_disk = False
+
+    def __repr__(self):
+        return f"{self.path} ({'in memory' if self.in_memory else 'on disk'})"
+
+    @property
+    def in_memory(self) -> bool:
+        return self._buffer is not None
+
+    @property
+    def size(self) -> int:
+        if self.in_memory:
+            return len(self._buffer)
+        if self._file:
+            self._file.flush()
+        return os.path.getsize(self.path)
+
+    def write(self, data: bytes):
+        if self.in_memory:
+            self._buffer += data
+            if len(self._buffer) > self.spill_threshold:
+                self._spill()
+        else:
+            self._file.write(data)
+
+    def close(self):
+        """Finish writing (flushes a spilled file)"""
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def reset(self):
+        """Discard everything written so far (e.g. before a retry)"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self._buffer = bytearray()
+        self.on_disk = False
+        self.meta = {}
+
+    def getvalue(self) -> bytes:
+        if self.in_memory:
+            return bytes(self._buffer)
+        self.close()
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def materialize(self) -> str:
+        """Make sure the content exists at self.path and return it"""
+        if not self.on_disk:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(self._buffer)
+            os.replace(tmp_path, self.path)
+            self.on_disk = True
+        self.close()
+        return self.path
+
+    def _spill(self):
+        self._file = open(self.path, 'wb')
+        self._file.write(self._buffer)
+        self._buffer = None
+        self.on_disk = True
+
+
+def input_source(source):
+    """
+    ffmpeg/ffprobe input for a path or an Artifact
+
+    Returns:
+        tuple: (input argument, bytes to send on stdin or None)
+    """
+    if isinstance(source, Artifact) and source.in_memory:
+        return 'pipe:0', source.getvalue()
+    return as_path(source), None
+
+
+def as_path(source) -> str:
+    """File path for a path or an Artifact (materialising it if needed)"""
+    return source.materialize() if isinstance(source, Artifact) else source
@@ -0,0 +1,199 @@
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+import requests
+from utils.http_client import http_client
+from utils.logger import setup_logger
+from utils.range_downloader import RangeDownloader
+
+logger = setup_logger()
+
+
+class AssetCache:
+    """
+    Content-addressed on-disk cache for remote assets
+
+    Objects are stored once under objects/<sha256>; an index maps each URL
+    to its object plus the ETag/Last-Modified needed to revalidate it. The
+    cache is kept under a byte budget by evicting least-recently-used
+    objects.
+
+    Files named objects/<sha256>.* (e.g. the clip's keyframe index, see
+    KEYFRAME_INDEX_DIR) belong to that object: they count towards the
+    budget and are evicted with it.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, revalidate_seconds: int = 600,
+                 downloader: RangeDownloader = None):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.max_bytes = max_bytes
+        self.revalidate_seconds = revalidate_seconds
+        self.downloader = downloader or RangeDownloader()
+        self._lock = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.index = self._load_index()
+
+    def fetch(self, url: str, expected_sha256: str = None) -> str:
+        """
+        Get the local path of a URL's content, downloading only if it changed
+
+        Args:
+            expected_sha256: Known content hash; a download that does not
+                match it is rejected
+
+        Returns:
+            str: Path to the cached object (do not modify or delete it)
+
+        If the origin cannot be reached or refuses the revalidation, a
+        cached copy is still returned; only a URL with nothing cached fails.
+        """
+        with self._lock:
+            entry = self.index.get(url)
+
+        if entry and expected_sha256 and entry['sha256'] != expected_sha256:
+            logger.info(f"Cached content of {url} does not match the expected hash, fetching again")
+            entry = None
+        if entry and os.path.exists(self.object_path(entry['sha256'])):
+            if time.time() - entry.get('checked_at', 0) < self.revalidate_seconds:
+                return self._hit(url, entry, "fresh")
+            headers = {}
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        else:
+            entry = None
+            headers = {}
+
+        try:
+            response = self._revalidate(url, headers)
+            if entry and response.status_code == 304:
+                entry['checked_at'] = time.time()
+                return self._hit(url, entry, "revalidated")
+            response.raise_for_status()
+            return self._store(url, response, expected_sha256)
+        except (requests.RequestException, ValueError) as e:
+            if not entry:
+                raise
+            logger.warning(f"Could not revalidate {url} ({e}), using the cached copy")
+            return self._hit(url, entry, "stale")
+
+    def _revalidate(self, url, headers):
+        """
+        Conditional request for the validators, size and range support
+
+        HEAD, since the body is fetched by the downloader (which reuses this
+        response). Hosts that refuse HEAD (presigned or GET-only URLs) get a
+        conditional GET whose body is never read.
+        """
+        response = http_client.head(url, 'download', headers=headers, allow_redirects=True)
+        if response.status_code not in (403, 405):
+            return response
+        response = http_client.get(url, 'download', headers=headers, stream=True)
+        response.close()
+        return response
+
+    def link(self, url: str, output_path: str, expected_sha256: str = None) -> str:
+        """
+        Fetch a URL and expose it at output_path as a hardlink (no copy)
+
+        Falls back to returning the cache path itself when hardlinks are not
+        possible (e.g. different filesystems).
+        """
+        path = self.fetch(url, expected_sha256)
+        try:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            os.link(path, output_path)
+            return output_path
+        except OSError as e:
+            logger.debug(f"Hardlink failed ({e}), using cache path directly")
+            return path
+
+    def content_hash(self, url: str):
+        """sha256 of the cached content for a URL, or None"""
+        with self._lock:
+            entry = self.index.get(url)
+        return entry['sha256'] if entry else None
+
+    def object_path(self, sha256: str) -> str:
+        return os.path.join(self.objects_dir, sha256)
+
+    def _hit(self, url, entry, how):
+        entry['last_used'] = time.time()
+        with self._lock:
+            self.index[url] = entry
+            self._save_index()
+        logger.info(f"✓ Cache hit ({how}): {url}")
+        return self.object_path(entry['sha256'])
+
+    def _store(self, url, response, expected_sha256=None):
+        # Stable per-URL name so an interrupted download resumes on the next run
+        tmp_path = os.path.join(self.objects_dir, '.download_' + hashlib.sha1(url.encode()).hexdigest())
+        sha256 = self.downloader.download(url, tmp_path, expected_sha256, head=response)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, self.object_path(sha256))
+
+        now = time.time()
+        entry = {
+            'sha256': sha256,
+            'size': size,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'checked_at': now,
+            'last_used': now,
+        }
+        with self._lock:
+            self.index[url] = entry
+            self._evict(keep=sha256)
+            self._save_index()
+        return self.object_path(sha256)
+
+    def _evict(self, keep: str):
+        """Drop least-recently-used objects until the cache fits the budget"""
+        objects = {}
+        for url, entry in self.index.items():
+            obj = objects.setdefault(entry['sha256'], {'size': entry['size'], 'last_used': 0, 'urls': []})
+            obj['last_used'] = max(obj['last_used'], entry.get('last_used', 0))
+            obj['urls'].append(url)
+
+        for sha256, obj in objects.items():
+            obj['size'] += sum(os.path.getsize(path) for path in self._sidecars(sha256))
+        total = sum(o['size'] for o in objects.values())
+        for sha256, obj in sorted(objects.items(), key=lambda item: item[1]['last_used']):
+            if total <= self.max_bytes:
+                break
+            if sha256 == keep:
+                continue
+            for path in [self.object_path(sha256)] + self._sidecars(sha256):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            for url in obj['urls']:
+                del self.index[url]
+            total -= obj['size']
+            logger.info(f"Evicted {obj['size'] / 1024 / 1024:.1f}MB from asset cache ({obj['urls'][0]})")
+
+    def _sidecars(self, sha256):
+        return glob.glob(glob.escape(self.object_path(sha256)) + '.*')
+
+    def _load_index(self):
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r') as f:
+                    return json.load(f)
+            except Exception as e:
+                logger.warning(f"Asset cache index unreadable, starting empty: {e}")
+        return {}
+
+    def _save_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(tmp_path, self.index_path)
@@ -0,0 +1,151 @@
+import subprocess
+import threading
+import time
+from collections import deque
+from utils.logger import setup_logger, with_log_context
+
+logger = setup_logger()
+
+
+class FFmpegStalledError(RuntimeError):
+    """FFmpeg stopped making progress and was killed"""
+
+
+class FFmpegRunner:
+    """Runs FFmpeg with streamed -progress output, a stall watchdog and a bounded stderr tail"""
+
+    def __init__(self, stall_timeout: float = 60, max_retries: int = 1, stderr_lines: int = 50,
+                 log_interval: float = 10):
+        self.stall_timeout = stall_timeout
+        self.max_retries = max_retries
+        self.stderr_lines = stderr_lines
+        self.log_interval = log_interval
+
+    def run(self, cmd: list, duration: float = None, label: str = 'ffmpeg', on_progress=None,
+            max_retries: int = None, paused=None):
+        """
+        Run an FFmpeg command, retrying if it stalls
+
+        Args:
+            cmd: FFmpeg argv (starting with 'ffmpeg')
+            duration: Expected output duration in seconds, for percent/ETA
+            label: Name used in log lines
+            on_progress: Optional callback receiving the live progress dict
+                (out_time, fps, speed, percent, eta)
+            max_retries: Override for this command (0 when a retry cannot
+                restart cleanly, e.g. output streamed to a consumer)
+            paused: Optional callable, True while FFmpeg is legitimately
+                blocked on its consumer; that time does not count as a stall
+
+        Raises:
+            subprocess.CalledProcessError: FFmpeg failed (stderr holds the tail only)
+            FFmpegStalledError: FFmpeg stalled on every attempt
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        for attempt in range(max_retries + 1):
+            try:
+                return self._run_once(cmd, duration, label, on_progress, paused)
+            except FFmpegStalledError as e:
+                if attempt >= max_retries:
+                    raise
+                logger.warning(f"{e} - retrying ({attempt + 1}/{max_retries})")
+
+    def _run_once(self, cmd, duration, label, on_progress, paused=None):
+        # Machine-readable progress on stdout, no interactive stats on stderr
+        full_cmd = cmd[:1] + ['-progress', 'pipe:1', '-nostats'] + cmd[1:]
+        proc = subprocess.Popen(full_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                stdin=subprocess.DEVNULL, text=True, errors='replace')
+
+        stderr_tail = deque(maxlen=self.stderr_lines)
+        progress = {'out_time': 0.0, 'fps': 0.0, 'speed': 0.0, 'percent': None, 'eta': None}
+        state = {'last_advance': time.monotonic(), 'last_log': time.monotonic()}
+
+        def read_stderr():
+            for line in proc.stderr:
+                stderr_tail.append(line.rstrip('\n'))
+
+        def read_progress():
+            block = {}
+            for line in proc.stdout:
+                key, _, value = line.strip().partition('=')
+                if key != 'progress':
+                    block[key] = value
+                    continue
+                self._update_progress(progress, state, block, duration)
+                if on_progress:
+                    on_progress(dict(progress))
+                now = time.monotonic()
+                if now - state['last_log'] >= self.log_interval:
+                    state['last_log'] = now
+                    self._log_progress(label, progress)
+                block = {}
+
+        readers = [threading.Thread(target=read_stderr, daemon=True),
+                   threading.Thread(target=with_log_context(read_progress), daemon=True)]
+        for reader in readers:
+            reader.start()
+
+        while True:
+            try:
+                proc.wait(timeout=1)
+                break
+            except subprocess.TimeoutExpired:
+                if paused and paused():
+                    # Blocked on the consumer (backpressure), not stalled
+                    state['last_advance'] = time.monotonic()
+                    continue
+                stalled_for = time.monotonic() - state['last_advance']
+                if stalled_for > self.stall_timeout:
+                    proc.kill()
+                    proc.wait()
+                    raise FFmpegStalledError(
+                        f"{label} stalled for {stalled_for:.0f}s at {progress['out_time']:.1f}s"
+                    )
+
+        for reader in readers:
+            reader.join(timeout=5)
+
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, full_cmd, stderr='\n'.join(stderr_tail))
+
+        if duration:
+            self._log_progress(label, progress)
+        return progress
+
+    def _update_progress(self, progress, state, block, duration):
+        out_time = self._parse_out_time(block)
+        if out_time is not None and out_time > progress['out_time']:
+            progress['out_time'] = out_time
+            state['last_advance'] = time.monotonic()
+
+        try:
+            progress['fps'] = float(block.get('fps', progress['fps']))
+        except ValueError:
+            pass
+        speed = block.get('speed', '').rstrip('x')
+        try:
+            progress['speed'] = float(speed)
+        except ValueError:
+            pass
+
+        if duration:
+            progress['percent'] = min(100.0, 100.0 * progress['out_time'] / duration)
+            if progress['speed'] > 0:
+                progress['eta'] = max(0.0, (duration - progress['out_time']) / progress['speed'])
+
+    def _parse_out_time(self, block):
+        # out_time_us is authoritative; out_time_ms is also microseconds in FFmpeg
+        for key in ('out_time_us', 'out_time_ms'):
+            try:
+                return int(block[key]) / 1_000_000
+            except (KeyError, ValueError):
+                continue
+        return None
+
+    def _log_progress(self, label, progress):
+        line = f"{label}: {progress['out_time']:.1f}s, {progress['fps']:.1f}fps, {progress['speed']:.2f}x"
+        if progress['percent'] is not None:
+            line += f", {progress['percent']:.0f}%"
+        if progress['eta'] is not None:
+            line += f", ETA {progress['eta']:.0f}s"
+        logger.info(line)
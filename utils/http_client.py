@@ -0,0 +1,133 @@
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from utils.logger import setup_logger
+
+logger = setup_logger()
+
+# Per call type: (connect, read) timeout and retry policy. Uploads are POSTs
+# that may have been processed, so they are only retried when the server
+# never saw them (connect errors) or explicitly asked us to come back later.
+PROFILES = {
+    'api': {
+        'timeout': (5, 30),
+        'retry': dict(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=('GET', 'HEAD')),
+    },
+    'download': {
+        'timeout': (5, 60),
+        'retry': dict(total=3, backoff_factor=1, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=('GET', 'HEAD')),
+    },
+    # Body transfers that retry and resume themselves (RangeDownloader):
+    # retrying here as well would multiply the attempts
+    'stream': {
+        'timeout': (5, 60),
+        'retry': dict(total=0),
+    },
+    'upload': {
+        'timeout': (10, 600),
+        'retry': dict(total=2, connect=2, read=0, backoff_factor=2, status_forcelist=(429, 503),
+                      allowed_methods=('POST',)),
+    },
+}
+
+
+class HttpClient:
+    """
+    Shared HTTP client: one keep-alive session per call type
+
+    Each session keeps a connection pool per host, so repeated calls to the
+    Graph API, Pixabay or the asset CDN reuse warm TCP/TLS connections.
+    Per-host request, error, byte and latency counters are kept for the
+    end-of-run summary.
+    """
+
+    def __init__(self, pool_size: int = 16):
+        self.pool_size = pool_size
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {'requests': 0, 'errors': 0, 'bytes_sent': 0,
+                                           'bytes_received': 0, 'seconds': 0.0})
+
+    def request(self, method: str, url: str, kind: str = 'api', **kwargs) -> requests.Response:
+        """
+        Send a request through the pooled session for `kind`
+
+        Args:
+            method: HTTP method
+            url: Target URL
+            kind: 'api', 'download', 'stream' or 'upload' (selects timeout and retries)
+            **kwargs: Passed to requests (an explicit timeout wins)
+
+        Returns:
+            requests.Response
+        """
+        kwargs.setdefault('timeout', PROFILES[kind]['timeout'])
+        host = urlparse(url).netloc
+        start = time.perf_counter()
+        try:
+            response = self._session(kind).request(method, url, **kwargs)
+        except requests.RequestException:
+            self._record(host, start, error=True)
+            raise
+
+        body = response.request.body
+        sent = len(body) if isinstance(body, (bytes, str)) else 0
+        # Streamed bodies are not read yet; count what the server announced
+        received = 0 if method == 'HEAD' else int(response.headers.get('Content-Length', 0) or 0)
+        self._record(host, start, error=response.status_code >= 400, sent=sent, received=received)
+        return response
+
+    def get(self, url: str, kind: str = 'api', **kwargs) -> requests.Response:
+        return self.request('GET', url, kind, **kwargs)
+
+    def head(self, url: str, kind: str = 'api', **kwargs) -> requests.Response:
+        return self.request('HEAD', url, kind, **kwargs)
+
+    def post(self, url: str, kind: str = 'api', **kwargs) -> requests.Response:
+        return self.request('POST', url, kind, **kwargs)
+
+    def stats(self) -> dict:
+        """Snapshot of per-host counters"""
+        with self._lock:
+            return {host: dict(s) for host, s in self._stats.items()}
+
+    def log_stats(self):
+        for host, s in sorted(self.stats().items()):
+            avg_ms = s['seconds'] / max(s['requests'], 1) * 1000
+            logger.info(f"HTTP {host}: {s['requests']} requests, {s['errors']} errors, "
+                        f"{s['bytes_sent'] / 1024 / 1024:.1f}MB sent, "
+                        f"{s['bytes_received'] / 1024 / 1024:.1f}MB received, {avg_ms:.0f}ms avg")
+
+    def _session(self, kind):
+        with self._lock:
+            session = self._sessions.get(kind)
+            if session is None:
+                adapter = HTTPAdapter(
+                    pool_connections=self.pool_size,
+                    pool_maxsize=self.pool_size,
+                    max_retries=Retry(raise_on_status=False, **PROFILES[kind]['retry']),
+                )
+                session = requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._sessions[kind] = session
+            return session
+
+    def _record(self, host, start, error=False, sent=0, received=0):
+        with self._lock:
+            s = self._stats[host]
+            s['requests'] += 1
+            s['errors'] += int(error)
+            s['bytes_sent'] += sent
+            s['bytes_received'] += received
+            s['seconds'] += time.perf_counter() - start
+
+
+# Shared instance so every module reuses the same connection pools
+http_client = HttpClient()
@@ -1,10 +1,88 @@
+import atexit
+import contextvars
+import json
 import logging
+import logging.handlers
+import os
+import queue
 import sys
 from datetime import datetime
 
+CONTEXT_FIELDS = ('run_id', 'episode', 'stage')
+_context = {field: contextvars.ContextVar(field, default=None) for field in CONTEXT_FIELDS}
+
+_listener = None
+
+
+def set_log_context(**fields):
+    """
+    Tag later log records from this thread with run_id, episode and/or stage
+
+    Pass None to clear a field.
+    """
+    for field, value in fields.items():
+        _context[field].set(value)
+
+
+def with_log_context(func):
+    """
+    Wrap func to run with the caller's log context, for worker threads
+
+    New threads start with an empty context, so without this their records
+    lose run_id/episode/stage. Each call runs in its own copy, so the
+    wrapper can be handed to a thread pool.
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+    return run
+
+
+class ContextFilter(logging.Filter):
+    """Copies the log context onto each record (runs in the thread that logs)"""
+
+    def filter(self, record):
+        tags = []
+        for field in CONTEXT_FIELDS:
+            value = _context[field].get()
+            setattr(record, field, value)
+            if value is not None:
+                tags.append(str(value))
+        record.context = f" [{' '.join(tags)}]" if tags else ''
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, with the log context as fields
+
+    Tracebacks arrive already folded into the message by QueueHandler.
+    """
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'file': record.filename,
+            'line': record.lineno,
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        return json.dumps(entry, ensure_ascii=False)
+
 
 def setup_logger(name='ViralReelsBot'):
-    """Setup production logger with file and console handlers"""
+    """
+    Setup production logger with console and rotating file handlers
+
+    The logger itself only has a QueueHandler: records are formatted and
+    written by a QueueListener thread, so log I/O never blocks the pipeline.
+    """
 
     logger = logging.getLogger(name)
     logger.setLevel(logging.INFO)
@@ -13,26 +91,59 @@ def setup_logger(name='ViralReelsBot'):
     if logger.handlers:
         return logger
 
+    queue_handler = logging.handlers.QueueHandler(queue.Queue(-1))
+    queue_handler.addFilter(ContextFilter())
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+
+    _start_listener(queue_handler.queue)
+    return logger
+
+
+def _start_listener(log_queue):
+    global _listener
+
+    # Settings come from the environment: config.py itself logs, so it cannot
+    # be imported here. Read on first use (after config.py has run load_dotenv).
+    log_dir = os.getenv('LOG_DIR', 'logs')
+    log_format = os.getenv('LOG_FORMAT', 'text')  # 'text' or 'json' (JSON lines) for the log file
+    log_rotation = os.getenv('LOG_ROTATION', 'time')  # 'time' (daily) or 'size'
+    log_max_bytes = int(os.getenv('LOG_MAX_MB', '50')) * 1024 * 1024
+    log_backup_count = int(os.getenv('LOG_BACKUP_COUNT', '14'))
+
     # Console handler
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(logging.INFO)
     console_format = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        '%(asctime)s - %(name)s - %(levelname)s%(context)s - %(message)s',
         datefmt='%Y-%m-%d %H:%M:%S'
     )
     console_handler.setFormatter(console_format)
 
     # File handler
-    log_filename = f"bot_{datetime.now().strftime('%Y%m%d')}.log"
-    file_handler = logging.FileHandler(log_filename)
+    os.makedirs(log_dir, exist_ok=True)
+    if log_format == 'json':
+        log_path = os.path.join(log_dir, 'bot.jsonl')
+        file_format = JsonFormatter()
+    else:
+        log_path = os.path.join(log_dir, 'bot.log')
+        file_format = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s%(context)s - [%(filename)s:%(lineno)d] - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
+    if log_rotation == 'size':
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_path, maxBytes=log_max_bytes, backupCount=log_backup_count, encoding='utf-8'
+        )
+    else:
+        file_handler = logging.handlers.TimedRotatingFileHandler(
+            log_path, when='midnight', backupCount=log_backup_count, encoding='utf-8'
+        )
     file_handler.setLevel(logging.DEBUG)
-    file_format = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
     file_handler.setFormatter(file_format)
 
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
-
-    return logger
\ No newline at end of file
+    _listener = logging.handlers.QueueListener(log_queue, console_handler, file_handler,
+                                               respect_handler_level=True)
+    _listener.start()
+    # Flush whatever is still queued when the process exits
+    atexit.register(_listener.stop)
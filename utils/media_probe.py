@@ -0,0 +1,170 @@
+import json
+import os
+import subprocess
+import threading
+from typing import Dict, Any
+from utils.artifact import Artifact
+from utils.logger import setup_logger
+
+logger = setup_logger()
+
+
+class MediaProbe:
+    """Runs ffprobe once per file and caches the parsed result"""
+
+    def __init__(self):
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def probe(self, file_path: str) -> Dict[str, Any]:
+        """
+        Probe a media file (format + all streams) with a single ffprobe call
+
+        Results are cached by (path, size, mtime), so a file that is rewritten
+        in place is probed again while unchanged files never are. In-memory
+        artifacts are piped to ffprobe and the result is kept in their meta.
+
+        Args:
+            file_path: Path to media file (or an Artifact)
+
+        Returns:
+            dict: duration, stream layout, codecs, fps and resolution
+        """
+        if isinstance(file_path, Artifact):
+            if not file_path.in_memory:
+                return self.probe(file_path.materialize())
+            if 'probe' not in file_path.meta:
+                file_path.meta['probe'] = self._probe_bytes(file_path.getvalue())
+            return file_path.meta['probe']
+
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        key = (stat.st_size, stat.st_mtime_ns)
+
+        with self._lock:
+            cached = self._cache.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+
+        cmd = [
+            'ffprobe', '-v', 'error',
+            '-show_format', '-show_streams',
+            '-of', 'json',
+            path
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        info = self._parse(json.loads(result.stdout))
+        logger.debug(f"Probed {file_path}: {info['duration']:.2f}s, "
+                     f"video={info['video_codec']}, audio={info['audio_codec']}")
+
+        with self._lock:
+            self._cache[path] = (key, info)
+        return info
+
+    def _probe_bytes(self, data: bytes) -> Dict[str, Any]:
+        cmd = ['ffprobe', '-v', 'error', '-show_format', '-show_streams', '-of', 'json', 'pipe:0']
+        result = subprocess.run(cmd, input=data, capture_output=True, check=True)
+        info = self._parse(json.loads(result.stdout))
+        if not info['duration']:
+            # A pipe cannot be seeked, so the container may not report a duration
+            info['duration'] = self._packet_duration(data)
+        logger.debug(f"Probed {len(data)} bytes from memory: {info['duration']:.2f}s")
+        return info
+
+    def _packet_duration(self, data: bytes) -> float:
+        """End time of the last packet of the first stream"""
+        cmd = [
+            'ffprobe', '-v', 'error', '-select_streams', '0',
+            '-show_entries', 'packet=pts_time,duration_time',
+            '-of', 'csv=p=0', 'pipe:0'
+        ]
+        result = subprocess.run(cmd, input=data, capture_output=True, check=True)
+        end = 0.0
+        for line in result.stdout.decode('utf-8', 'replace').splitlines():
+            pts, _, duration = line.partition(',')
+            pts, duration = self._to_float(pts), self._to_float(duration)
+            if pts is not None:
+                end = max(end, pts + (duration or 0.0))
+        return end
+
+    def get_duration(self, file_path: str) -> float:
+        """Get container duration in seconds"""
+        return self.probe(file_path)['duration']
+
+    def get_resolution(self, file_path: str):
+        """Get (width, height) of the first video stream, or None"""
+        info = self.probe(file_path)
+        if not info['has_video']:
+            return None
+        return info['width'], info['height']
+
+    def has_audio_stream(self, file_path: str) -> bool:
+        """Check if file has an audio stream"""
+        try:
+            return self.probe(file_path)['has_audio']
+        except Exception as e:
+            logger.warning(f"Probe failed for {file_path}: {e}")
+            return False
+
+    def invalidate(self, file_path: str):
+        """Drop a cached entry (e.g. before a file is deleted)"""
+        with self._lock:
+            self._cache.pop(os.path.abspath(file_path), None)
+
+    def _parse(self, data: dict) -> Dict[str, Any]:
+        fmt = data.get('format', {})
+        streams = data.get('streams', [])
+
+        video = next((s for s in streams if s.get('codec_type') == 'video'), None)
+        audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+
+        duration = self._to_float(fmt.get('duration'))
+        if duration is None:
+            # Some containers only carry per-stream durations
+            durations = [self._to_float(s.get('duration')) for s in streams]
+            durations = [d for d in durations if d is not None]
+            duration = max(durations) if durations else 0.0
+
+        return {
+            'duration': duration,
+            'format_name': fmt.get('format_name'),
+            'size': int(fmt.get('size', 0) or 0),
+            'bit_rate': int(fmt.get('bit_rate', 0) or 0),
+            'streams': [
+                {
+                    'index': s.get('index'),
+                    'codec_type': s.get('codec_type'),
+                    'codec_name': s.get('codec_name'),
+                }
+                for s in streams
+            ],
+            'has_video': video is not None,
+            'has_audio': audio is not None,
+            'video_codec': video.get('codec_name') if video else None,
+            'audio_codec': audio.get('codec_name') if audio else None,
+            'width': int(video['width']) if video and 'width' in video else None,
+            'height': int(video['height']) if video and 'height' in video else None,
+            'fps': self._parse_rate(video.get('avg_frame_rate') or video.get('r_frame_rate')) if video else None,
+            'sample_rate': int(audio['sample_rate']) if audio and 'sample_rate' in audio else None,
+            'channels': audio.get('channels') if audio else None,
+        }
+
+    def _parse_rate(self, rate: str):
+        """Parse ffprobe rational like '30000/1001'"""
+        if not rate or rate == '0/0':
+            return None
+        num, _, den = rate.partition('/')
+        try:
+            return float(num) / float(den or 1)
+        except (ValueError, ZeroDivisionError):
+            return None
+
+    def _to_float(self, value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+
+
+# Shared instance so every module hits the same cache
+media_probe = MediaProbe()
@@ -0,0 +1,27 @@
+import subprocess
+import numpy as np
+from utils.artifact import input_source
+
+# One PCM layout for every in-process audio stage (mixing, loudness), so
+# what is measured is exactly what is mixed
+SAMPLE_RATE = 44100
+CHANNELS = 2
+
+
+def decode_pcm(source) -> np.ndarray:
+    """
+    Decode any audio input (path or Artifact) with ffmpeg
+
+    Returns:
+        np.ndarray: float32 samples, shape (samples, CHANNELS), at SAMPLE_RATE
+    """
+    source, data = input_source(source)
+    cmd = [
+        'ffmpeg', '-v', 'error',
+        '-i', source,
+        '-f', 'f32le', '-acodec', 'pcm_f32le',
+        '-ac', str(CHANNELS), '-ar', str(SAMPLE_RATE),
+        'pipe:1'
+    ]
+    result = subprocess.run(cmd, input=data, capture_output=True, check=True)
+    return np.frombuffer(result.stdout, dtype=np.float32).reshape(-1, CHANNELS)
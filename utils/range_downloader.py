@@ -0,0 +1,220 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.http_client import http_client
+from utils.logger import setup_logger, with_log_context
+
+logger = setup_logger()
+
+BUFFER_SIZE = 1024 * 1024
+
+
+class RangesIgnored(Exception):
+    """The server advertised byte ranges but answered a ranged GET with the whole file"""
+
+
+class RangeDownloader:
+    """
+    HTTP downloader that fetches large files as concurrent byte ranges
+
+    Ranges are written into a preallocated <output>.part file and completed
+    ranges are recorded in <output>.part.json, so a retry or a restarted
+    process only fetches what is still missing. Servers without range
+    support (or that ignore Range despite Accept-Ranges) get a single
+    stream, resumed with Range + If-Range when the server gave a strong
+    validator (otherwise it starts over).
+
+    Retries happen here, per range or stream attempt, so the body requests
+    use the 'stream' HTTP profile, which does not retry on its own.
+    """
+
+    def __init__(self, connections: int = 4, part_size: int = 8 * 1024 * 1024,
+                 min_parallel_size: int = 16 * 1024 * 1024, retries: int = 3):
+        self.connections = connections
+        self.part_size = part_size
+        self.min_parallel_size = min_parallel_size
+        self.retries = retries
+
+    def download(self, url: str, output_path: str, expected_sha256: str = None, head=None) -> str:
+        """
+        Download url to output_path
+
+        Args:
+            url: Source URL
+            output_path: Destination (written atomically on success)
+            expected_sha256: Optional content hash to verify
+            head: HEAD response the caller already has for url (saves
+                sending another one)
+
+        Returns:
+            str: sha256 of the downloaded file
+
+        Raises:
+            ValueError: Size or hash mismatch (partial state is discarded)
+        """
+        if head is None:
+            head = http_client.head(url, 'download', allow_redirects=True)
+            head.raise_for_status()
+        size = int(head.headers.get('Content-Length', 0) or 0)
+        ranges_ok = head.headers.get('Accept-Ranges', '').lower() == 'bytes'
+        validator = head.headers.get('ETag') or head.headers.get('Last-Modified')
+
+        part_path = output_path + '.part'
+        start = time.perf_counter()
+
+        if ranges_ok and size >= self.min_parallel_size:
+            try:
+                self._download_ranges(url, part_path, size, validator)
+            except RangesIgnored as e:
+                logger.warning(f"{e}, downloading {url} as a single stream")
+                self._discard(part_path)
+                self._download_stream(url, part_path, False, validator)
+        else:
+            self._download_stream(url, part_path, ranges_ok, validator)
+
+        actual_size = os.path.getsize(part_path)
+        if size and actual_size != size:
+            self._discard(part_path)
+            raise ValueError(f"Size mismatch for {url}: got {actual_size}, expected {size}")
+
+        sha256 = self._hash_file(part_path)
+        if expected_sha256 and sha256 != expected_sha256:
+            self._discard(part_path)
+            raise ValueError(f"Hash mismatch for {url}: got {sha256}, expected {expected_sha256}")
+
+        os.replace(part_path, output_path)
+        self._discard(part_path)
+
+        elapsed = time.perf_counter() - start
+        logger.info(f"Downloaded {actual_size / 1024 / 1024:.1f}MB in {elapsed:.1f}s "
+                    f"({actual_size / 1024 / 1024 / max(elapsed, 1e-6):.1f}MB/s): {url}")
+        return sha256
+
+    def _download_ranges(self, url, part_path, size, validator):
+        state_path = part_path + '.json'
+        state = self._load_state(state_path)
+        if state.get('url') != url or state.get('size') != size or state.get('validator') != validator:
+            # Different or changed file: start over
+            state = {'url': url, 'size': size, 'validator': validator, 'done': []}
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+        # Preallocate so every range can be written in place
+        if not os.path.exists(part_path) or os.path.getsize(part_path) != size:
+            with open(part_path, 'ab') as f:
+                f.truncate(size)
+
+        n_parts = -(-size // self.part_size)
+        done = set(state['done'])
+        missing = [i for i in range(n_parts) if i not in done]
+        if done:
+            logger.info(f"Resuming download: {len(done)}/{n_parts} ranges already on disk")
+        logger.info(f"Fetching {len(missing)} ranges over {self.connections} connections: {url}")
+
+        lock = threading.Lock()
+        fd = os.open(part_path, os.O_WRONLY)
+        try:
+            def fetch(i):
+                first = i * self.part_size
+                last = min(size, first + self.part_size) - 1
+                self._with_retries(lambda: self._fetch_range(url, fd, first, last), f"range {i}")
+                with lock:
+                    state['done'].append(i)
+                    self._save_state(state_path, state)
+
+            with ThreadPoolExecutor(max_workers=self.connections) as pool:
+                list(pool.map(with_log_context(fetch), missing))
+        finally:
+            os.close(fd)
+
+    def _fetch_range(self, url, fd, first, last):
+        headers = {'Range': f"bytes={first}-{last}"}
+        with http_client.get(url, 'stream', headers=headers, stream=True) as response:
+            response.raise_for_status()
+            if response.status_code == 200:
+                raise RangesIgnored("Server ignored the Range request (HTTP 200)")
+            if response.status_code != 206:
+                raise ValueError(f"Unexpected response to a Range request (HTTP {response.status_code})")
+            offset = first
+            for chunk in response.iter_content(chunk_size=BUFFER_SIZE):
+                os.pwrite(fd, chunk, offset)
+                offset += len(chunk)
+        if offset != last + 1:
+            raise ValueError(f"Short range: got {offset - first} of {last + 1 - first} bytes")
+
+    def _download_stream(self, url, part_path, ranges_ok, validator):
+        state_path = part_path + '.json'
+        # Weak ETags cannot be used with If-Range; without a validator a
+        # resumed tail could belong to a different version of the file
+        resumable = ranges_ok and bool(validator) and not validator.startswith('W/')
+        state = self._load_state(state_path)
+        if not resumable or state.get('url') != url or state.get('validator') != validator:
+            self._discard(part_path)
+        if resumable:
+            self._save_state(state_path, {'url': url, 'validator': validator})
+
+        def attempt():
+            offset = os.path.getsize(part_path) if resumable and os.path.exists(part_path) else 0
+            headers = {'Range': f"bytes={offset}-", 'If-Range': validator} if offset else {}
+            with http_client.get(url, 'stream', headers=headers, stream=True) as response:
+                if offset and response.status_code == 416:
+                    # Nothing left to fetch, or the .part is longer than the file now is
+                    total = response.headers.get('Content-Range', '').rpartition('/')[2]
+                    if total.isdigit() and int(total) == offset:
+                        return
+                    self._discard(part_path)
+                    raise ValueError(f"Stale partial download ({offset} bytes), starting over")
+                response.raise_for_status()
+                # 200 instead of 206: the file changed (If-Range) or the range was ignored
+                mode = 'ab' if offset and response.status_code == 206 else 'wb'
+                with open(part_path, mode, buffering=BUFFER_SIZE) as f:
+                    for chunk in response.iter_content(chunk_size=BUFFER_SIZE):
+                        f.write(chunk)
+
+        try:
+            self._with_retries(attempt, "download")
+        except Exception:
+            # Do not leave a .part behind that every later attempt would trip over
+            self._discard(part_path)
+            raise
+
+    def _with_retries(self, func, what):
+        for attempt in range(self.retries + 1):
+            try:
+                return func()
+            except RangesIgnored:
+                raise
+            except Exception as e:
+                if attempt >= self.retries:
+                    raise
+                delay = 2 ** attempt
+                logger.warning(f"{what} failed ({e}), retrying in {delay}s")
+                time.sleep(delay)
+
+    def _hash_file(self, path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(BUFFER_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _load_state(self, state_path):
+        try:
+            with open(state_path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_state(self, state_path, state):
+        tmp_path = state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, state_path)
+
+    def _discard(self, part_path):
+        for path in (part_path, part_path + '.json'):
+            if os.path.exists(path):
+                os.remove(path)
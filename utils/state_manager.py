@@ -1,5 +1,8 @@
 import json
 import os
+import sqlite3
+import threading
+from contextlib import contextmanager
 from typing import Dict, Any
 from utils.logger import setup_logger
 
@@ -7,25 +10,30 @@ logger = setup_logger()
 
 
 class StateManager:
-    """Manages persistent state between bot runs"""
-
-    def __init__(self, state_file: str):
-        self.state_file = state_file
-        self.state = self._load_state()
-
-    def _load_state(self) -> Dict[str, Any]:
-        """Load state from JSON file"""
-        if os.path.exists(self.state_file):
-            try:
-                with open(self.state_file, 'r') as f:
-                    state = json.load(f)
-                    logger.info(f"State loaded: {state}")
-                    return state
-            except Exception as e:
-                logger.error(f"Error loading state: {e}")
-                return self._get_default_state()
-        else:
-            return self._get_default_state()
+    """
+    Manages persistent state between bot runs
+
+    State lives in a SQLite database in WAL mode. Every update is its own
+    transaction, committed immediately, and the rotations are read-modify-
+    write under BEGIN IMMEDIATE, so several workers (threads or processes)
+    never hand out the same index and a crash cannot leave a half-written
+    file. On first use, an existing JSON state file is imported once.
+    """
+
+    SCHEMA_VERSION = 1
+
+    def __init__(self, db_path: str, legacy_file: str = None):
+        self.db_path = db_path
+        self.legacy_file = legacy_file
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._migrate()
+
+    @property
+    def state(self) -> Dict[str, Any]:
+        """Snapshot of the current state"""
+        rows = self._connection().execute('SELECT key, value FROM state').fetchall()
+        return {key: json.loads(value) for key, value in rows}
 
     def _get_default_state(self) -> Dict[str, Any]:
         """Return default state"""
@@ -37,37 +45,97 @@ class StateManager:
         }
 
     def save_state(self):
-        """Save state to JSON file"""
-        try:
-            with open(self.state_file, 'w') as f:
-                json.dump(self.state, f, indent=2)
-            logger.info(f"State saved: {self.state}")
-        except Exception as e:
-            logger.error(f"Error saving state: {e}")
+        """Kept for callers of the JSON version: every update is already committed"""
 
     def get_next_category(self, categories: list) -> str:
         """Get next category in rotation"""
-        index = self.state['category_index']
-        category = categories[index]
+        return categories[self._rotate('category_index', len(categories))]
 
-        # Update index for next run
-        self.state['category_index'] = (index + 1) % len(categories)
-
-        return category
+    def peek_next_category(self, categories: list) -> str:
+        """Category get_next_category would return, without advancing the rotation"""
+        index = self._get(self._connection(), 'category_index', 0) % len(categories)
+        return categories[index]
 
     def get_next_video_index(self, total_videos: int) -> int:
         """Get next video index in rotation"""
-        index = self.state['video_index']
-
-        # Update index for next run
-        self.state['video_index'] = (index + 1) % total_videos
-
-        return index
+        return self._rotate('video_index', total_videos)
 
     def increment_run_count(self):
         """Increment total run counter"""
-        self.state['total_runs'] += 1
+        with self._transaction() as db:
+            self._set(db, 'total_runs', self._get(db, 'total_runs', 0) + 1)
 
     def update_last_run(self, timestamp: str):
         """Update last run timestamp"""
-        self.state['last_run'] = timestamp
\ No newline at end of file
+        with self._transaction() as db:
+            self._set(db, 'last_run', timestamp)
+
+    def _rotate(self, key, length):
+        """Return the current index and advance it, atomically"""
+        with self._transaction() as db:
+            # Modulo again in case the list shrank since the index was stored
+            index = self._get(db, key, 0) % length
+            self._set(db, key, (index + 1) % length)
+        return index
+
+    def _migrate(self):
+        """Create the schema and import the JSON state file, once"""
+        with self._transaction() as db:
+            if db.execute('PRAGMA user_version').fetchone()[0] >= self.SCHEMA_VERSION:
+                return
+            db.execute('CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            legacy = self._load_legacy()
+            state = self._get_default_state()
+            state.update(legacy or {})
+            for key, value in state.items():
+                self._set(db, key, value)
+            db.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+
+        if legacy is not None:
+            # Set aside only once the import is committed
+            os.replace(self.legacy_file, self.legacy_file + '.imported')
+            logger.info(f"Imported state from {self.legacy_file}: {legacy}")
+        logger.info(f"State store ready: {self.db_path}")
+
+    def _load_legacy(self):
+        """The old JSON state, or None if there is none to import"""
+        if not self.legacy_file or not os.path.exists(self.legacy_file):
+            return None
+        try:
+            with open(self.legacy_file, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading legacy state {self.legacy_file}: {e}")
+            return None
+
+    @contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes the write lock up front, so concurrent read-modify-writes serialize
+        db = self._connection()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def _connection(self):
+        """One connection per thread (sqlite3 connections are not shared across threads)"""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            # WAL + NORMAL: no fsync per commit, still never corrupted by a crash
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    @staticmethod
+    def _get(db, key, default=None):
+        row = db.execute('SELECT value FROM state WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    @staticmethod
+    def _set(db, key, value):
+        db.execute('INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)', (key, json.dumps(value)))
@@ -0,0 +1,143 @@
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from utils.logger import setup_logger
+
+logger = setup_logger()
+
+# Flat per-episode files written into TEMP_DIR before workspaces existed
+LEGACY_PREFIXES = ('audio_', 'video_', 'music_', 'subs_', 'output_')
+
+
+class Workspace:
+    """
+    Per-episode scratch directories under a byte budget
+
+    Each episode gets its own directory, on tmpfs when it is enabled and has
+    room for the episode estimate, otherwise under WORKSPACE_DIR. Directories
+    are removed when the episode ends, successful or not. Opening a new one
+    blocks while the budget is used up (backpressure), and gc() removes
+    directories left behind by crashed runs.
+    """
+
+    def __init__(self, config):
+        self.disk_root = config.WORKSPACE_DIR
+        self.tmpfs_root = config.WORKSPACE_TMPFS_DIR if config.WORKSPACE_USE_TMPFS else None
+        self.budget = config.WORKSPACE_BUDGET_BYTES
+        self.tmpfs_budget = config.WORKSPACE_TMPFS_BUDGET_BYTES
+        self.episode_estimate = config.WORKSPACE_EPISODE_BYTES
+        self.max_age = config.WORKSPACE_GC_HOURS * 3600
+        self.wait_timeout = config.WORKSPACE_WAIT_SECONDS
+        self.legacy_dir = config.TEMP_DIR
+        self._reserved = {}  # path -> (bytes, on_tmpfs)
+        self._cond = threading.Condition()
+        os.makedirs(self.disk_root, exist_ok=True)
+
+    @contextmanager
+    def episode(self, name: str):
+        """
+        Yield a fresh directory for one episode, removed on exit
+
+        Raises:
+            TimeoutError: The budget stayed exhausted for WORKSPACE_WAIT_SECONDS
+        """
+        path = self._reserve(name)
+        try:
+            yield path
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+            with self._cond:
+                self._reserved.pop(path, None)
+                self._cond.notify_all()
+            logger.debug(f"Released workspace {path}")
+
+    def gc(self):
+        """Remove workspaces (and legacy flat temp files) older than WORKSPACE_GC_HOURS"""
+        cutoff = time.time() - self.max_age
+        removed = 0
+        freed = 0
+        for root in filter(None, (self.disk_root, self.tmpfs_root)):
+            if not os.path.isdir(root):
+                continue
+            for name in os.listdir(root):
+                path = os.path.join(root, name)
+                if path in self._reserved or self._mtime(path) >= cutoff:
+                    continue
+                freed += self._size(path)
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+
+        if os.path.isdir(self.legacy_dir):
+            for name in os.listdir(self.legacy_dir):
+                path = os.path.join(self.legacy_dir, name)
+                if name.startswith(LEGACY_PREFIXES) and os.path.isfile(path) and self._mtime(path) < cutoff:
+                    freed += self._size(path)
+                    os.remove(path)
+                    removed += 1
+
+        if removed:
+            logger.info(f"Workspace GC: removed {removed} orphaned entries ({freed / 1024 / 1024:.1f}MB)")
+
+    def _reserve(self, name):
+        deadline = time.monotonic() + self.wait_timeout
+        with self._cond:
+            while True:
+                on_tmpfs = self._tmpfs_has_room()
+                if on_tmpfs or self._disk_in_use() + self.episode_estimate <= self.budget or not self._reserved:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Workspace budget ({self.budget / 1024 ** 3:.1f}GB) exhausted")
+                logger.info("Workspace budget exhausted, waiting for a running episode to finish...")
+                self._cond.wait(timeout=min(remaining, 30))
+
+            root = self.tmpfs_root if on_tmpfs else self.disk_root
+            path = os.path.join(root, name)
+            os.makedirs(path, exist_ok=True)
+            self._reserved[path] = (self.episode_estimate, on_tmpfs)
+
+        logger.info(f"Workspace: {path}{' (tmpfs)' if on_tmpfs else ''}")
+        return path
+
+    def _tmpfs_has_room(self):
+        if not self.tmpfs_root:
+            return False
+        try:
+            os.makedirs(self.tmpfs_root, exist_ok=True)
+            stat = os.statvfs(self.tmpfs_root)
+        except OSError:
+            return False
+        free = stat.f_bavail * stat.f_frsize
+        reserved = sum(size for size, on_tmpfs in self._reserved.values() if on_tmpfs)
+        return (free >= self.episode_estimate * 2 and
+                reserved + self.episode_estimate <= self.tmpfs_budget)
+
+    def _disk_in_use(self):
+        """Reservations of running episodes plus whatever else sits in the disk root"""
+        reserved = sum(size for size, on_tmpfs in self._reserved.values() if not on_tmpfs)
+        others = sum(self._size(os.path.join(self.disk_root, name))
+                     for name in os.listdir(self.disk_root)
+                     if os.path.join(self.disk_root, name) not in self._reserved)
+        return reserved + others
+
+    @staticmethod
+    def _size(path):
+        if os.path.isfile(path):
+            return os.path.getsize(path)
+        total = 0
+        for dirpath, _, filenames in os.walk(path):
+            for filename in filenames:
+                try:
+                    total += os.path.getsize(os.path.join(dirpath, filename))
+                except OSError:
+                    pass
+        return total
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return time.time()